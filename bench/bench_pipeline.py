@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Offline benchmark of the generation / translation pipeline against bench.mock_server.
+#
+#   python -m bench.bench_pipeline --jobs 20 --concurrency 4 --image-size 2048x2048
+#
+# The mock runs in a separate process so CPU time and peak memory are the app side only.
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(args):
+    port = free_port()
+    command = [
+        sys.executable, "-m", "bench.mock_server", "--port", str(port),
+        "--latency", str(args.latency),
+        "--queue-delay", str(args.queue_delay),
+        "--model-time", str(args.model_time),
+        "--submit-failure-rate", str(args.submit_failure_rate),
+        "--job-failure-rate", str(args.job_failure_rate),
+        "--image-size", args.image_size,
+        "--translation-latency", str(args.translation_latency),
+        "--translation-failure-rate", str(args.translation_failure_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate)
+    ]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/_stats", timeout=1)
+            return process, base_url
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("mock server did not start")
+
+
+def mock_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/_stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(values):
+    return {
+        "p50": round(percentile(values, 0.5), 3),
+        "p95": round(percentile(values, 0.95), 3),
+        "max": round(max(values), 3) if values else 0.0,
+        "mean": round(statistics.mean(values), 3) if values else 0.0
+    }
+
+
+def run(args):
+    process, base_url = start_mock(args)
+    try:
+        # Module-level URLs are read at import, so point them at the mock first
+        os.environ["ETERNAL_API_BASE"] = base_url
+        os.environ["OPENROUTER_API_BASE"] = f"{base_url}/api/v1"
+        os.environ["POLL_INTERVAL"] = str(args.poll_interval)
+        scratch = tempfile.mkdtemp()
+        os.environ["LEDGER_PATH"] = os.path.join(scratch, "bench_ledger.jsonl")
+        os.environ["IMAGE_STORE_DIR"] = os.path.join(scratch, "image_store")
+        os.environ["HASH_INDEX_PATH"] = os.path.join(scratch, "image_store", "hashes.jsonl")
+        if args.push:
+            callback_port = free_port()
+            os.environ["CALLBACK_PORT"] = str(callback_port)
+            os.environ["CALLBACK_URL"] = f"http://127.0.0.1:{callback_port}/callback"
+        from generation import StageTimer, build_payload, run_generation
+        from translation import load_translation_models, translate_all
+
+        report = {"config": vars(args)}
+
+        tracemalloc.start()
+        cpu_start = time.process_time()
+        wall_start = time.monotonic()
+
+        def one_job(index):
+            timer = StageTimer()
+            payload = build_payload(f"benchmark prompt {index}", None, args.model)
+            timer.mark("encode")
+            return run_generation("bench-key", payload, timer=timer, session="bench")
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(one_job, range(args.jobs)))
+
+        wall = time.monotonic() - wall_start
+        cpu = time.process_time() - cpu_start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = mock_stats(base_url)
+
+        ok = [result for result in results if result["status"] == "ok"]
+        report["generation"] = {
+            "jobs": args.jobs,
+            "ok": len(ok),
+            "failed": args.jobs - len(ok),
+            "wall_s": round(wall, 3),
+            "jobs_per_s": round(args.jobs / wall, 3) if wall else 0.0,
+            "submit_to_display_s": summarize([result["timings"]["total"] for result in ok]),
+            "overhead_s": summarize([
+                result["timings"]["total"] - args.queue_delay - args.model_time for result in ok
+            ]),
+            "requests_per_job": round(sum(stats["requests"].values()) / args.jobs, 2),
+            "requests_by_endpoint": stats["requests"],
+            "cpu_s": round(cpu, 3),
+            "cpu_ms_per_job": round(cpu * 1000 / args.jobs, 2),
+            "peak_python_mb": round(peak / 1024 / 1024, 2),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+        }
+
+        if args.translations:
+            models = load_translation_models()
+            latencies = []
+            cpu_start = time.process_time()
+            for _ in range(args.translations):
+                start = time.monotonic()
+                translate_all("bench-key", models, "ベンチマーク用のプロンプト", session="bench")
+                latencies.append(time.monotonic() - start)
+            report["translation"] = {
+                "fanouts": args.translations,
+                "models": len(models),
+                "fanout_latency_s": summarize(latencies),
+                "overhead_s": summarize([latency - args.translation_latency for latency in latencies]),
+                "cpu_ms_per_fanout": round((time.process_time() - cpu_start) * 1000 / args.translations, 2)
+            }
+        return report
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def print_report(report):
+    generation = report["generation"]
+    print(f"Generation: {generation['ok']}/{generation['jobs']} ok in {generation['wall_s']}s "
+          f"({generation['jobs_per_s']} jobs/s)")
+    for name in ("submit_to_display_s", "overhead_s"):
+        values = generation[name]
+        print(f"  {name:<22} p50 {values['p50']:>8}  p95 {values['p95']:>8}  max {values['max']:>8}")
+    print(f"  requests/job           {generation['requests_per_job']}  {generation['requests_by_endpoint']}")
+    print(f"  cpu                    {generation['cpu_s']}s ({generation['cpu_ms_per_job']} ms/job)")
+    print(f"  peak memory            {generation['peak_python_mb']} MB python, {generation['max_rss_mb']} MB rss")
+    if "translation" in report:
+        translation = report["translation"]
+        values = translation["fanout_latency_s"]
+        print(f"Translation: {translation['fanouts']} fan-outs x {translation['models']} models")
+        print(f"  fanout_latency_s       p50 {values['p50']:>8}  p95 {values['p95']:>8}  max {values['max']:>8}")
+        print(f"  cpu                    {translation['cpu_ms_per_fanout']} ms/fan-out")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app pipeline against a local mock upstream")
+    parser.add_argument("--jobs", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--model", default="Qwen-Image-Edit-2509")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--push", action="store_true", help="receive completions on the callback listener")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--queue-delay", type=float, default=0.5)
+    parser.add_argument("--model-time", type=float, default=1.0)
+    parser.add_argument("--submit-failure-rate", type=float, default=0.0)
+    parser.add_argument("--job-failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", default="1024x1024")
+    parser.add_argument("--translations", type=int, default=5)
+    parser.add_argument("--translation-latency", type=float, default=0.2)
+    parser.add_argument("--translation-failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="share of translation requests answered with 429")
+    parser.add_argument("--seed", type=int, help="mock server random seed (repeatable failures)")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# Per-rerun cost of app.py as the session history grows.
+#
+#   python -m bench.bench_rerun --history 0,10,100,1000 --reruns 20
+#
+# Runs the script in-process (streamlit.testing AppTest) with a synthetic history of each size,
+# with and without a reference image, and records the script time the app measures itself
+# (st.session_state.last_script_ms) and the bytes of delta messages sent per rerun.
+# Exits 1 when the median script time or delta bytes exceed the budget.
+import io
+import os
+import sys
+import json
+import argparse
+import tempfile
+from bench.bench_pipeline import summarize
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+DELTA_BYTES_BUDGET = 64 * 1024  # per rerun
+
+
+def fake_history(size):
+    return [{
+        "url": f"https://example.invalid/images/{index:06d}.png",
+        "prompt": f"benchmark prompt {index}, cinematic lighting, highly detailed",
+        "model": "Qwen",
+        "timestamp": f"2025-01-01 00:{index // 60 % 60:02d}:{index % 60:02d}",
+        "size_kb": "812.4",
+        "dimensions": "1024x1024",
+        "reference_image": None,
+        "timings": {"encode": 0.01, "submit": 0.2, "queue": 4.0, "model": 12.0, "download": 0.5, "total": 16.71}
+    } for index in range(size)]
+
+
+def reference_png():
+    from PIL import Image
+    buffered = io.BytesIO()
+    Image.frombytes("RGB", (512, 512), os.urandom(512 * 512 * 3)).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+class DeltaCounter:
+    # Counts the serialized size of every delta the script enqueues for the browser
+    def __init__(self):
+        from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+        self.bytes = 0
+        original = ForwardMsgQueue.enqueue
+        counter = self
+
+        def enqueue(queue, msg):
+            if msg.WhichOneof("type") == "delta":
+                counter.bytes += msg.ByteSize()
+            return original(queue, msg)
+
+        ForwardMsgQueue.enqueue = enqueue
+
+    def take(self):
+        value, self.bytes = self.bytes, 0
+        return value
+
+
+def measure(history_size, with_reference, reruns, counter, reference):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.session_state["generated_images"] = fake_history(history_size)
+    at.run()
+    if with_reference:
+        at.file_uploader[0].upload("reference.png", reference, "image/png").run()
+    if at.exception:
+        raise RuntimeError(f"app raised: {at.exception[0].message}")
+
+    script_ms, delta_bytes = [], []
+    counter.take()
+    for _ in range(reruns):
+        at.run()
+        script_ms.append(at.session_state["last_script_ms"])
+        delta_bytes.append(counter.take())
+    return {
+        "history": history_size,
+        "reference": with_reference,
+        "script_ms": summarize(script_ms),
+        "delta_bytes": summarize(delta_bytes)
+    }
+
+
+def main(argv=None):
+    from config import RERUN_BUDGET_MS
+
+    parser = argparse.ArgumentParser(description="Measure per-rerun script time and delta bytes as history grows")
+    parser.add_argument("--history", default="0,10,100,1000", help="comma-separated history sizes")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=RERUN_BUDGET_MS, help="median script time budget")
+    parser.add_argument("--bytes-budget", type=int, default=DELTA_BYTES_BUDGET, help="median delta bytes budget")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    args = parser.parse_args(argv)
+
+    # No network or side effects from the script itself
+    os.environ.setdefault("ETERNAL_API_KEY", "bench-key")
+    os.environ["METRICS_PORT"] = "0"
+    scratch = tempfile.mkdtemp()
+    os.environ["LEDGER_PATH"] = os.path.join(scratch, "bench_ledger.jsonl")
+    os.environ["IMAGE_STORE_DIR"] = os.path.join(scratch, "image_store")
+    os.environ["HASH_INDEX_PATH"] = os.path.join(scratch, "image_store", "hashes.jsonl")
+
+    counter = DeltaCounter()
+    reference = reference_png()
+    rows = []
+    for history_size in [int(value) for value in args.history.split(",") if value.strip()]:
+        for with_reference in (False, True):
+            rows.append(measure(history_size, with_reference, args.reruns, counter, reference))
+
+    failures = [
+        row for row in rows
+        if row["script_ms"]["p50"] > args.budget_ms or row["delta_bytes"]["p50"] > args.bytes_budget
+    ]
+
+    if args.json:
+        print(json.dumps({"budget_ms": args.budget_ms, "bytes_budget": args.bytes_budget, "rows": rows}, indent=2))
+    else:
+        print(f"{'history':>8} {'ref':>4} {'ms p50':>8} {'ms p95':>8} {'bytes p50':>10} {'bytes max':>10}")
+        for row in rows:
+            flag = "  OVER BUDGET" if row in failures else ""
+            print(f"{row['history']:>8} {'yes' if row['reference'] else 'no':>4} "
+                  f"{row['script_ms']['p50']:>8} {row['script_ms']['p95']:>8} "
+                  f"{row['delta_bytes']['p50']:>10} {row['delta_bytes']['max']:>10}{flag}")
+        print(f"Budget: {args.budget_ms} ms, {args.bytes_budget} bytes per rerun (median)")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
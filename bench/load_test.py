@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# Multi-session load test: N headless websocket sessions against a real `streamlit run app.py`,
+# with the upstream APIs served by bench.mock_server.
+#
+#   pip install websockets
+#   python -m bench.load_test --sessions 1,5,10,25 --jobs-per-session 2
+#
+# For each N it reports server thread count and RSS, idle rerun latency measured by a probe
+# session while the others generate, job latency and completion throughput.
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from bench.bench_pipeline import free_port, start_mock, summarize
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def start_app(mock_url, args):
+    port = free_port()
+    env = dict(os.environ)
+    scratch = tempfile.mkdtemp()
+    env.update({
+        "ETERNAL_API_KEY": "bench-key",
+        "ETERNAL_API_BASE": mock_url,
+        "OPENROUTER_API_BASE": f"{mock_url}/api/v1",
+        "POLL_INTERVAL": str(args.poll_interval),
+        "LEDGER_PATH": os.path.join(scratch, "load_ledger.jsonl"),
+        "IMAGE_STORE_DIR": os.path.join(scratch, "image_store"),
+        "HASH_INDEX_PATH": os.path.join(scratch, "image_store", "hashes.jsonl"),
+        "METRICS_PORT": "0"
+    })
+    command = [
+        sys.executable, "-m", "streamlit", "run", APP_PATH,
+        "--server.port", str(port), "--server.headless", "true",
+        "--browser.gatherUsageStats", "false"
+    ]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/_stcore/health", timeout=1)
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("streamlit did not start")
+
+
+def process_sample(pid):
+    # (threads, rss_mb) from /proc; None on platforms without it
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["Threads"]), int(fields["VmRSS"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class Session:
+    # One browser tab: a websocket speaking Streamlit's BackMsg / ForwardMsg protocol
+    def __init__(self, port):
+        self.url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        self.ws = None
+        self.buttons = {}
+        self.auto_reruns = {}  # fragment id -> interval, as registered by st.fragment(run_every=...)
+
+    async def connect(self):
+        import websockets
+        self.ws = await websockets.connect(self.url, max_size=None, subprotocols=["streamlit"])
+
+    async def close(self):
+        await self.ws.close()
+
+    async def run(self, click=None, fragment=None, timeout=600):
+        # Request one script run (optionally clicking a button, or only rerunning a fragment the
+        # way the browser's run_every timer does) and wait until it and any st.rerun() it
+        # triggers have finished. Returns (seconds, bytes received, markdown bodies seen)
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.page_script_hash = ""
+        if click:
+            widget = message.rerun_script.widget_states.widgets.add()
+            widget.id = self.buttons[click]
+            widget.trigger_value = True
+        if fragment:
+            message.rerun_script.fragment_id = fragment
+            message.rerun_script.is_auto_rerun = True
+        else:
+            self.auto_reruns = {}
+
+        start = time.monotonic()
+        await self.ws.send(message.SerializeToString())
+        received = 0
+        texts = []
+        while True:
+            data = await asyncio.wait_for(self.ws.recv(), timeout)
+            received += len(data)
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "button":
+                    self.buttons[element.button.label] = element.button.id
+                elif element_type == "markdown":
+                    texts.append(element.markdown.body)
+            elif kind == "auto_rerun":
+                self.auto_reruns[forward.auto_rerun.fragment_id] = forward.auto_rerun.interval
+            elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return time.monotonic() - start, received, texts
+
+
+async def run_level(port, pid, sessions, args):
+    samples = []
+    stop = asyncio.Event()
+
+    async def sampler():
+        while not stop.is_set():
+            sample = process_sample(pid)
+            if sample:
+                samples.append(sample)
+            await asyncio.sleep(0.25)
+
+    probe_latencies = []
+
+    async def probe():
+        # An idle user rerunning the page while everyone else generates
+        session = Session(port)
+        await session.connect()
+        await session.run()
+        while not stop.is_set():
+            seconds, _, _ = await session.run()
+            probe_latencies.append(seconds)
+            await asyncio.sleep(args.probe_interval)
+        await session.close()
+
+    job_latencies = []
+    completed = 0
+
+    async def user(index):
+        nonlocal completed
+        await asyncio.sleep(index * args.ramp)
+        session = Session(port)
+        await session.connect()
+        await session.run()
+        for _ in range(args.jobs_per_session):
+            # Generate only queues the job; the status fragment refreshes until the result shows
+            start = time.monotonic()
+            _, _, texts = await session.run(click="Generate")
+            while session.auto_reruns and not any(text.startswith("Size:") for text in texts):
+                fragment, interval = next(iter(session.auto_reruns.items()))
+                await asyncio.sleep(interval)
+                _, _, texts = await session.run(fragment=fragment)
+            if any(text.startswith("Size:") for text in texts):
+                completed += 1
+                job_latencies.append(time.monotonic() - start)
+        await session.close()
+
+    sampler_task = asyncio.create_task(sampler())
+    probe_task = asyncio.create_task(probe())
+    start = time.monotonic()
+    await asyncio.gather(*(user(index) for index in range(sessions)))
+    wall = time.monotonic() - start
+    stop.set()
+    await asyncio.gather(sampler_task, probe_task)
+
+    return {
+        "sessions": sessions,
+        "jobs": sessions * args.jobs_per_session,
+        "completed": completed,
+        "wall_s": round(wall, 2),
+        "throughput_jobs_per_s": round(completed / wall, 3) if wall else 0.0,
+        "job_latency_s": summarize(job_latencies),
+        "probe_rerun_s": summarize(probe_latencies),
+        "peak_threads": max((sample[0] for sample in samples), default=None),
+        "peak_rss_mb": round(max((sample[1] for sample in samples), default=0.0), 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive N concurrent Streamlit sessions against the mock upstream")
+    parser.add_argument("--sessions", default="1,5,10", help="comma-separated session counts to test")
+    parser.add_argument("--jobs-per-session", type=int, default=1)
+    parser.add_argument("--ramp", type=float, default=0.05, help="seconds between session starts")
+    parser.add_argument("--probe-interval", type=float, default=0.5)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--queue-delay", type=float, default=1.0)
+    parser.add_argument("--model-time", type=float, default=3.0)
+    parser.add_argument("--submit-failure-rate", type=float, default=0.0)
+    parser.add_argument("--job-failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", default="1024x1024")
+    parser.add_argument("--translation-latency", type=float, default=0.2)
+    parser.add_argument("--translation-failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="share of translation requests answered with 429")
+    parser.add_argument("--seed", type=int, help="mock server random seed (repeatable failures)")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        import websockets  # noqa: F401
+    except ImportError:
+        parser.error("the load test needs the 'websockets' package (pip install websockets)")
+
+    mock_process, mock_url = start_mock(args)
+    app_process, port = start_app(mock_url, args)
+    levels = []
+    try:
+        idle = process_sample(app_process.pid)
+        for sessions in [int(value) for value in args.sessions.split(",") if value.strip()]:
+            levels.append(asyncio.run(run_level(port, app_process.pid, sessions, args)))
+    finally:
+        app_process.terminate()
+        mock_process.terminate()
+        app_process.wait()
+        mock_process.wait()
+
+    if args.json:
+        print(json.dumps({"idle": idle, "levels": levels}, indent=2))
+        return
+
+    if idle:
+        print(f"Idle server: {idle[0]} threads, {idle[1]:.1f} MB rss")
+    print(f"{'N':>4} {'done':>9} {'jobs/s':>7} {'job p50':>8} {'job p95':>8} "
+          f"{'rerun p50':>10} {'rerun p95':>10} {'threads':>8} {'rss MB':>7}")
+    for level in levels:
+        print(f"{level['sessions']:>4} {level['completed']:>4}/{level['jobs']:<4} {level['throughput_jobs_per_s']:>7} "
+              f"{level['job_latency_s']['p50']:>8} {level['job_latency_s']['p95']:>8} "
+              f"{level['probe_rerun_s']['p50']:>10} {level['probe_rerun_s']['p95']:>10} "
+              f"{level['peak_threads']!s:>8} {level['peak_rss_mb']:>7}")
+
+
+if __name__ == "__main__":
+    main()
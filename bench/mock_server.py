@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# Local stand-in for the EternalAI and OpenRouter endpoints the app uses.
+#
+#   python -m bench.mock_server --port 8900 --queue-delay 1 --model-time 3 --image-size 1024x1024
+#
+# then run the app against it:
+#
+#   ETERNAL_API_BASE=http://127.0.0.1:8900 OPENROUTER_API_BASE=http://127.0.0.1:8900/api/v1 streamlit run app.py
+import io
+import os
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONFIG = {
+    "latency": 0.0,              # added to every request (seconds)
+    "queue_delay": 1.0,          # poll returns 404 "Server preparing" for this long
+    "model_time": 3.0,           # then "processing" for this long
+    "submit_failure_rate": 0.0,  # POST /creative-ai/image answers 500
+    "job_failure_rate": 0.0,     # job ends with status "failed"
+    "image_size": (1024, 1024),
+    "image_format": "PNG",
+    "translation_latency": 0.5,
+    "translation_failure_rate": 0.0,
+    "rate_limit_rate": 0.0,      # chat completions answer 429 with Retry-After
+    "seed": None
+}
+
+
+class MockUpstream:
+    def __init__(self, host="127.0.0.1", port=0, **config):
+        self.config = dict(DEFAULT_CONFIG)
+        self.config.update(config)
+        self.random = random.Random(self.config["seed"])
+        self.jobs = {}
+        self.stats = {}
+        self.bytes_sent = 0
+        self._images = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {}
+            self.bytes_sent = 0
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.stats[endpoint] = self.stats.get(endpoint, 0) + 1
+
+    def _chance(self, rate):
+        with self._lock:
+            return self.random.random() < rate
+
+    def image_bytes(self):
+        # Random noise so the encoded size is realistic (does not compress away)
+        key = (tuple(self.config["image_size"]), self.config["image_format"])
+        with self._lock:
+            if key not in self._images:
+                from PIL import Image
+                width, height = key[0]
+                image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+                buffered = io.BytesIO()
+                image.save(buffered, format=key[1])
+                self._images[key] = buffered.getvalue()
+            return self._images[key]
+
+    def _push_when_done(self, request_id, callback_url):
+        # Post the finished job to the app's callback listener, like a webhook-capable upstream
+        def post():
+            with self._lock:
+                job = self.jobs.get(request_id)
+            status = self.job_status(job)
+            if status not in ("done", "failed"):
+                return
+            body = {"request_id": request_id, "status": status}
+            if status == "done":
+                body["result_url"] = f"{self.base_url}/images/{request_id}.{self.config['image_format'].lower()}"
+            self._count("callback")
+            try:
+                request = urllib.request.Request(callback_url, data=json.dumps(body).encode(),
+                                                 headers={"Content-Type": "application/json"})
+                urllib.request.urlopen(request, timeout=5).close()
+            except OSError:
+                pass
+
+        delay = self.config["queue_delay"] + self.config["model_time"]
+        timer = threading.Timer(delay, post)
+        timer.daemon = True
+        timer.start()
+
+    def job_status(self, job):
+        if job.get("cancelled"):
+            return "cancelled"
+        elapsed = time.monotonic() - job["created"]
+        if elapsed < self.config["queue_delay"]:
+            return None  # 404 "Server preparing"
+        if elapsed < self.config["queue_delay"] + self.config["model_time"]:
+            return "processing"
+        return "failed" if job["fails"] else "done"
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _send(self, status, body=b"", content_type="application/json", headers=None):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                with upstream._lock:
+                    upstream.bytes_sent += len(body)
+
+            def do_POST(self):
+                body = self._read_body()
+                time.sleep(upstream.config["latency"])
+                path = self.path.split("?")[0]
+
+                if path == "/creative-ai/image":
+                    upstream._count("submit")
+                    if upstream._chance(upstream.config["submit_failure_rate"]):
+                        return self._send(500, {"error": "mock submit failure"})
+                    request_id = uuid.uuid4().hex
+                    with upstream._lock:
+                        upstream.jobs[request_id] = {
+                            "created": time.monotonic(),
+                            "fails": upstream.random.random() < upstream.config["job_failure_rate"]
+                        }
+                    try:
+                        callback_url = json.loads(body or b"{}").get("callback_url")
+                    except ValueError:
+                        callback_url = None
+                    if callback_url:
+                        upstream._push_when_done(request_id, callback_url)
+                    return self._send(200, {"request_id": request_id})
+
+                if path.startswith("/creative-ai/cancel/"):
+                    # Served when the app runs with ETERNAL_CANCEL_PATH=/creative-ai/cancel/{request_id}
+                    upstream._count("cancel")
+                    with upstream._lock:
+                        job = upstream.jobs.get(path.rsplit("/", 1)[-1])
+                        if job:
+                            job["cancelled"] = True
+                    return self._send(200 if job else 404, {"cancelled": bool(job)})
+
+                if path.endswith("/chat/completions"):
+                    upstream._count("chat")
+                    time.sleep(upstream.config["translation_latency"])
+                    if upstream._chance(upstream.config["rate_limit_rate"]):
+                        return self._send(429, {"error": "rate limited"}, headers={"Retry-After": "1"})
+                    if upstream._chance(upstream.config["translation_failure_rate"]):
+                        return self._send(500, {"error": "mock translation failure"})
+                    return self._send(200, {
+                        "choices": [{"message": {"content": "A mock English translation"}}],
+                        "usage": {"prompt_tokens": 120, "completion_tokens": 20, "total_tokens": 140}
+                    })
+
+                return self._send(404, {"error": "not found"})
+
+            def do_GET(self):
+                time.sleep(upstream.config["latency"])
+                path = self.path.split("?")[0]
+
+                if path.startswith("/creative-ai/poll-result/"):
+                    upstream._count("poll")
+                    request_id = path.rsplit("/", 1)[-1]
+                    with upstream._lock:
+                        job = upstream.jobs.get(request_id)
+                    status = upstream.job_status(job) if job else None
+                    if status is None:
+                        return self._send(404, {"error": "Server preparing"})
+                    body = {"status": status}
+                    if status == "done":
+                        body["result_url"] = f"{upstream.base_url}/images/{request_id}.{upstream.config['image_format'].lower()}"
+                    return self._send(200, body)
+
+                if path.startswith("/images/"):
+                    upstream._count("image")
+                    return self._send(200, upstream.image_bytes(),
+                                      content_type=f"image/{upstream.config['image_format'].lower()}")
+
+                if path.endswith("/credits"):
+                    upstream._count("credits")
+                    return self._send(200, {"data": {"total_credits": 10.0, "total_usage": 1.25}})
+
+                if path == "/_stats":
+                    with upstream._lock:
+                        stats = {"requests": dict(upstream.stats), "bytes_sent": upstream.bytes_sent}
+                    return self._send(200, stats)
+
+                return self._send(404, {"error": "not found"})
+
+        return Handler
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local EternalAI / OpenRouter stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=DEFAULT_CONFIG["latency"])
+    parser.add_argument("--queue-delay", type=float, default=DEFAULT_CONFIG["queue_delay"])
+    parser.add_argument("--model-time", type=float, default=DEFAULT_CONFIG["model_time"])
+    parser.add_argument("--submit-failure-rate", type=float, default=0.0)
+    parser.add_argument("--job-failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=parse_size, default=DEFAULT_CONFIG["image_size"])
+    parser.add_argument("--image-format", default=DEFAULT_CONFIG["image_format"])
+    parser.add_argument("--translation-latency", type=float, default=DEFAULT_CONFIG["translation_latency"])
+    parser.add_argument("--translation-failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG["seed"])
+    args = parser.parse_args(argv)
+
+    upstream = MockUpstream(
+        args.host, args.port,
+        latency=args.latency,
+        queue_delay=args.queue_delay,
+        model_time=args.model_time,
+        submit_failure_rate=args.submit_failure_rate,
+        job_failure_rate=args.job_failure_rate,
+        image_size=args.image_size,
+        image_format=args.image_format,
+        translation_latency=args.translation_latency,
+        translation_failure_rate=args.translation_failure_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+    print(f"Mock upstream on {upstream.base_url}")
+    try:
+        upstream.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Static catalogs, built once per process on import (not on every Streamlit rerun)
+
+# Style Presets (English only, no icons)
+STYLE_PRESETS = {
+    "None (Custom)": "",
+    "Realistic Portrait": "photorealistic, professional portrait photography, natural lighting, shot on Canon EOS R5, 85mm f/1.2, natural skin texture, realistic features, shallow depth of field, soft studio lighting, lifelike",
+    "Cinematic": "cinematic photography, film grain, anamorphic lens, natural color grading, shot on ARRI Alexa, dramatic lighting, movie still, cinematic composition",
+    "Street Photography": "candid street photography, natural lighting, realistic atmosphere, documentary style, shot on Leica M10, 35mm lens, photojournalism, authentic moment",
+    "Landscape": "landscape photography, golden hour lighting, natural colors, shot on Sony A7R IV, 24mm lens, vivid details, realistic scenery, high dynamic range"
+}
+
+# Model options (short name -> EternalAI model_id)
+MODEL_OPTIONS = {
+    "Qwen": "Qwen-Image-Edit-2509",
+    "NB Pro": "gemini-3-pro-image-preview",
+    "NB": "gemini-2.5-flash-image",
+    "SD4.5": "seedream-4-5-251128",
+    "Flux": "flux-2-pro"
+}
+
+MODEL_FULL_NAMES = {
+    "Qwen": "Qwen Image Edit (最も柔軟・最安・18+)",
+    "NB Pro": "Nano Banana Pro (最高品質・高速)",
+    "NB": "Nano Banana (高品質)",
+    "SD4.5": "Seedream 4.5 (新モデル)",
+    "Flux": "Flux 2 Pro (プロ品質)"
+}
+
+ASPECT_RATIO_OPTIONS = {
+    "Auto": "auto",
+    "21:9": "21:9",
+    "16:9": "16:9",
+    "4:3": "4:3",
+    "1:1": "1:1",
+    "9:16": "9:16"
+}
+
+# Placeholder size for the Text-to-Image "Before" area
+ASPECT_PREVIEW_SIZES = {
+    "21:9": (420, 180),
+    "16:9": (320, 180),
+    "4:3": (240, 180),
+    "1:1": (180, 180),
+    "9:16": (180, 320),
+    "auto": (180, 180)
+}
+
+# Script time budgets (ms); runs over budget are logged, and bench/bench_rerun.py fails above
+# RERUN_BUDGET_MS. A rerun costs ~20-45 ms (median) whatever the history size: nearly all of it
+# is Streamlit's fixed cost for the ~90 elements and 6 fragments on the page, so the budget
+# catches work that grows with history or uploads, not that floor
+STARTUP_BUDGET_MS = 500
+RERUN_BUDGET_MS = 60
+
+# Seconds between refreshes of the queue position / job progress panel
+JOB_REFRESH_INTERVAL = 1.0
+
+# Seconds between checks while the OpenRouter credit balance is still being fetched
+CREDITS_REFRESH_INTERVAL = 1.0
+
+# What each model can do, for "Auto" routing (tier: 1 standard, 2 high, 3 best quality)
+MODEL_CAPABILITIES = {
+    "Qwen": {"text_to_image": True, "image_to_image": True, "tier": 1},
+    "NB Pro": {"text_to_image": True, "image_to_image": True, "tier": 3},
+    "NB": {"text_to_image": True, "image_to_image": True, "tier": 2},
+    "SD4.5": {"text_to_image": True, "image_to_image": True, "tier": 2},
+    "Flux": {"text_to_image": True, "image_to_image": True, "tier": 3}
+}
+
+# Minimum tier for "Auto" routing
+QUALITY_TIERS = {
+    "Any": 1,
+    "High": 2,
+    "Best": 3
+}
+
+# Hedge target when a job runs past its model's recent p95 (see generation.run_hedged)
+HEDGE_FALLBACKS = {
+    "Qwen": "NB",
+    "NB Pro": "NB",
+    "NB": "Qwen",
+    "SD4.5": "Qwen",
+    "Flux": "Qwen"
+}
+
+# Parameter sweep: denoising strengths on offer (the slider's steps), jobs per sweep, contact sheet width
+STRENGTH_STEPS = [round(step / 10, 1) for step in range(1, 10)]
+SWEEP_MAX_JOBS = 24
+SWEEP_COLUMNS = 4
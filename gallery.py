@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import threading
+from imageworker import build_sprite_sheet, run_image_task
+
+# Gallery mode packs history thumbnails into sprite sheets (one JPEG per page of GALLERY_PAGE_SIZE
+# images), so a large gallery loads in a handful of requests; each image is a cell at a pixel offset.
+# Sheets live in static/sprites and are served by Streamlit's static file serving.
+SPRITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "sprites")
+GALLERY_THUMB = int(os.environ.get("GALLERY_THUMB", "128"))
+GALLERY_PAGE_SIZE = int(os.environ.get("GALLERY_PAGE_SIZE", "50"))
+GALLERY_SHEET_COLUMNS = 10
+GALLERY_MAX_SHEETS = 200  # Oldest sheet files are deleted beyond this
+
+
+def sheet_name(shas, thumb, columns):
+    # Content-addressed: the same page of images always maps to the same (browser-cached) file
+    return hashlib.sha256(f"{thumb}:{columns}:{','.join(shas)}".encode()).hexdigest()[:16] + ".jpg"
+
+
+class SpriteSheets:
+    # Builds and caches one sheet per page. Pages hold images in history order, so only the last
+    # page grows; when it does, the cached sheet for its first image is extended with the new
+    # cells instead of being redrawn.
+    def __init__(self, directory=SPRITE_DIR, page_size=GALLERY_PAGE_SIZE, thumb=GALLERY_THUMB,
+                 columns=GALLERY_SHEET_COLUMNS):
+        self.directory = directory
+        self.page_size = page_size
+        self.thumb = thumb
+        self.columns = columns
+        self.rows = -(-page_size // columns)
+        self._lock = threading.Lock()
+        self._pages = {}  # sha256 of a page's first image -> shas in its latest sheet
+
+    def pages(self, items):
+        # items: [(sha256, local path)] oldest first, without repeats. Returns one dict per page:
+        # {"file", "width", "height", "cells": [(sha256, x, y)]}
+        pages = []
+        for start in range(0, len(items), self.page_size):
+            page = items[start:start + self.page_size]
+            shas = [sha256 for sha256, _ in page]
+            name = self._sheet(shas, [path for _, path in page])
+            pages.append({
+                "file": name,
+                "width": self.columns * self.thumb,
+                "height": self.rows * self.thumb,
+                "cells": [(sha256, (cell % self.columns) * self.thumb, (cell // self.columns) * self.thumb)
+                          for cell, sha256 in enumerate(shas)]
+            })
+        return pages
+
+    def _sheet(self, shas, paths):
+        name = sheet_name(shas, self.thumb, self.columns)
+        out_path = os.path.join(self.directory, name)
+        with self._lock:
+            if os.path.exists(out_path):
+                self._pages[shas[0]] = shas
+                return name
+            previous = self._pages.get(shas[0])
+        os.makedirs(self.directory, exist_ok=True)
+        base_path = None
+        start = 0
+        if previous and shas[:len(previous)] == previous:
+            base_path = os.path.join(self.directory, sheet_name(previous, self.thumb, self.columns))
+            if os.path.exists(base_path):
+                start = len(previous)
+            else:
+                base_path = None
+        run_image_task(build_sprite_sheet, paths[start:], out_path, self.thumb, self.columns, self.rows,
+                       base_path, start)
+        with self._lock:
+            self._pages[shas[0]] = shas
+        self._evict()
+        return name
+
+    def _evict(self):
+        try:
+            sheets = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.endswith(".jpg")]
+            sheets.sort(key=os.path.getmtime)
+            for path in sheets[:-GALLERY_MAX_SHEETS]:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+_sheets = None
+_sheets_lock = threading.Lock()
+
+
+def get_sprite_sheets():
+    # Process-wide sheet cache shared by all sessions
+    global _sheets
+    with _sheets_lock:
+        if _sheets is None:
+            _sheets = SpriteSheets()
+        return _sheets
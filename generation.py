@@ -0,0 +1,649 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import hmac
+import queue
+import logging
+import secrets
+import threading
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+import metrics
+import ratelimit
+from keypool import get_key_pool
+from imagestore import download_to_store
+from imageworker import encode_image, run_image_task
+from ledger import estimate_cost, get_ledger
+from routing import get_router
+from similarity import index_stored_image, trim_local_store
+
+# EternalAI Legacy API (supports both Text-to-Image and Image-to-Image)
+ETERNAL_API_BASE = os.environ.get("ETERNAL_API_BASE", "https://open.eternalai.org").rstrip("/")
+CREATE_URL = f"{ETERNAL_API_BASE}/creative-ai/image"
+POLL_URL = f"{ETERNAL_API_BASE}/creative-ai/poll-result"
+# Upstream cancel endpoint, if the API offers one, e.g. "/creative-ai/cancel/{request_id}" (POST).
+# Without it a cancelled job only stops being polled
+CANCEL_PATH = os.environ.get("ETERNAL_CANCEL_PATH", "")
+
+SUBMIT_TIMEOUT = 30                                           # seconds for the create request
+POLL_INTERVAL = float(os.environ.get("POLL_INTERVAL", "2"))  # seconds between polls of one job (minimum)
+POLL_MAX_INTERVAL = 10                                        # early on in a long job, poll this rarely
+POLL_TIMEOUT = 300                                            # max 5 minutes
+POLL_WORKERS = 4                                              # concurrent poll requests
+
+# Push completion: with CALLBACK_URL set (the address at which EternalAI can reach this process),
+# each job is submitted with that callback_url and a listener on CALLBACK_PORT polls the job
+# right away when a completion is posted. Once the first push has arrived (the upstream honours
+# callback_url), polling only runs as a slow safety net; until then it stays adaptive.
+# The listener is reachable by anyone, so the callback_url carries a per-process secret token,
+# and a push is only a hint: the result itself always comes from an authenticated poll
+CALLBACK_URL = os.environ.get("CALLBACK_URL", "")
+CALLBACK_PORT = int(os.environ.get("CALLBACK_PORT", "9465"))
+CALLBACK_TOKEN = secrets.token_urlsafe(24)
+PUSH_POLL_INTERVAL = 15
+
+# Hedging: a job still running past its model's recent p95 gets a duplicate on a fallback model.
+# Duplicates are paid for too, so their estimated cost is capped (USD per rolling HEDGE_SPEND_WINDOW
+# seconds; hedges that never reached the API are refunded)
+HEDGE_SPEND_CAP = float(os.environ.get("HEDGE_SPEND_CAP", "1.0"))
+HEDGE_SPEND_WINDOW = float(os.environ.get("HEDGE_SPEND_WINDOW", "3600"))
+
+DONE_STATUSES = ("done", "success", "completed")
+RUNNING_STATUSES = ("pending", "processing")
+
+logger = logging.getLogger("generation")
+
+
+class StageTimer:
+    # Monotonic timestamps at the end of each pipeline stage
+    # encode: reference image -> base64, dispatch: waiting in the local job queue (scheduler.py),
+    # throttle: waiting for a submit rate-limit token, submit: POST until request_id,
+    # queue: "Server preparing" (404) until the first status, model: until done, download: result fetch
+    # upstream_latency(): from the POST to the model finishing, i.e. without our own queueing
+    STAGES = ("encode", "dispatch", "throttle", "submit", "queue", "model", "download")
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.marks = {}
+
+    def mark(self, stage):
+        self.marks[stage] = time.monotonic()
+
+    def durations(self):
+        timings = {}
+        previous = self.start
+        for stage in self.STAGES:
+            if stage in self.marks:
+                timings[stage] = round(self.marks[stage] - previous, 3)
+                previous = self.marks[stage]
+        timings["total"] = round(previous - self.start, 3)
+        return timings
+
+    def upstream_latency(self):
+        # Seconds since the create POST went out (until "model" once marked); None before the POST
+        if "throttle" not in self.marks:
+            return None
+        return self.marks.get("model", time.monotonic()) - self.marks["throttle"]
+
+
+def build_prompt(base_prompt, aspect_value, model_short, has_reference):
+    # Add aspect ratio to prompt (if not Auto) - stronger emphasis for NB Pro
+    if aspect_value == "auto":
+        return base_prompt
+
+    # Determine orientation description
+    if aspect_value in ["9:16", "3:4"]:
+        orientation_desc = "vertical portrait orientation"
+    elif aspect_value in ["21:9", "16:9", "4:3"]:
+        orientation_desc = "horizontal landscape orientation"
+    else:  # 1:1
+        orientation_desc = "square format"
+
+    # Extra strong emphasis for NB Pro with image-to-image
+    if model_short == "NB Pro" and has_reference:
+        return f"{base_prompt}, MUST be {orientation_desc}, MUST maintain {aspect_value} aspect ratio, {aspect_value} format, ignore reference image aspect ratio, output must be {aspect_value}"
+    return f"{base_prompt}, {orientation_desc}, aspect ratio {aspect_value}, {aspect_value} format"
+
+
+def encode_reference(uploaded_file):
+    # Returns (data URL, encoded size in bytes); the resize/encode runs in the image worker pool
+    # (max 1024x1024, to keep the request well under 5MB)
+    return run_image_task(encode_image, uploaded_file.getvalue())
+
+
+def build_payload(final_prompt, image_base64, model_id, strength=None):
+    # Payload configuration (Legacy API format)
+    # strength: denoising strength for Image-to-Image (0.1 subtle - 0.9 dramatic)
+    content_items = [
+        {
+            "type": "text",
+            "text": final_prompt
+        }
+    ]
+
+    # Add image to content array for Image-to-Image mode (following official docs)
+    if image_base64:
+        content_items.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image_base64,
+                "filename": "input.jpg"
+            }
+        })
+
+    payload = {
+        "messages": [{
+            "role": "user",
+            "content": content_items
+        }],
+        "type": "edit" if image_base64 else "new",
+        "model_id": model_id  # Always include model_id
+    }
+    if image_base64 and strength is not None:
+        payload["strength"] = strength
+    return payload
+
+
+def extract_image_url(res_data):
+    # Try multiple possible field names for image URL
+    return (res_data.get("result_url") or
+            res_data.get("url") or
+            res_data.get("result") or
+            res_data.get("image_url") or
+            res_data.get("output_url"))
+
+
+def download_result(img_url):
+    # Stream the result into the local image store (see imagestore.py); returns
+    # {"size_kb", "dimensions", "path", "sha256", "error"}
+    try:
+        stored = download_to_store(img_url)
+        dimensions = f"{stored['width']}x{stored['height']}" if stored["width"] else "Unknown"
+        return {"size_kb": stored["bytes"] / 1024, "dimensions": dimensions,
+                "path": stored["path"], "sha256": stored["sha256"], "error": None}
+    except Exception as e:
+        return {"size_kb": 0, "dimensions": "Unknown", "path": None, "sha256": None, "error": str(e)}
+
+
+class PollWatch:
+    # One job's subscription to the poller: poll responses and pushed results arrive on a queue
+    def __init__(self, api_key, request_id):
+        self.api_key = api_key
+        self.request_id = request_id
+        self._updates = queue.Queue()
+
+    def next(self, timeout):
+        # Next poll response for this request_id, or None once timeout passes
+        try:
+            update = self._updates.get(timeout=max(0, timeout))
+        except queue.Empty:
+            return None
+        if isinstance(update, Exception):
+            raise update
+        return update
+
+
+class Poller:
+    # Polls every outstanding request_id from one dispatcher thread.
+    # The interval adapts to the job: while the model's usual completion time (its p50) is still
+    # far off, polls are sparse (up to POLL_MAX_INTERVAL); near and past it, every interval.
+    # The "eternalai.poll" rate limit caps the total (POLL_QPS): with many jobs outstanding,
+    # each one is simply polled less often. Watches on the same request_id share its polls.
+    # A completion pushed to the callback listener makes its job due for a poll at once (see push()).
+    def __init__(self, interval=POLL_INTERVAL, workers=POLL_WORKERS, push_enabled=False):
+        self.interval = interval
+        self.push_enabled = push_enabled
+        self.push_seen = False  # Set by the first push: the upstream honours callback_url
+        self._entries = {}  # request_id -> {"watches", "api_key", "submitted", "expected", "due", "in_flight"}
+        self._early = set()  # request_ids pushed before their watch (the push can beat the POST's response)
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="poller")
+        self._http = requests.Session()
+        self._thread = None
+
+    def _next_interval(self, entry):
+        if self.push_seen:
+            return PUSH_POLL_INTERVAL
+        if entry["expected"] is None:
+            return self.interval
+        remaining = entry["submitted"] + entry["expected"] - time.monotonic()
+        return min(POLL_MAX_INTERVAL, max(self.interval, remaining / 2))
+
+    def watch(self, api_key, request_id, expected=None):
+        # expected: the model's typical submit-to-done time (seconds), if known
+        watch = PollWatch(api_key, request_id)
+        with self._cond:
+            entry = self._entries.get(request_id)
+            if entry is None:
+                entry = self._entries[request_id] = {
+                    "watches": [], "api_key": api_key, "submitted": time.monotonic(),
+                    "expected": expected, "in_flight": False
+                }
+                entry["due"] = time.monotonic() + self._next_interval(entry)
+            entry["watches"].append(watch)
+            if request_id in self._early:
+                self._early.discard(request_id)
+                entry["due"] = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="poller", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return watch
+
+    def unwatch(self, watch):
+        with self._cond:
+            entry = self._entries.get(watch.request_id)
+            if entry and watch in entry["watches"]:
+                entry["watches"].remove(watch)
+                if not entry["watches"]:
+                    del self._entries[watch.request_id]
+
+    def push(self, request_id):
+        # A completion posted to the callback listener: poll that job now instead of at its next
+        # due time. The body is not trusted; the poll response is what the waiting jobs get
+        metrics.push_callbacks.inc()
+        with self._cond:
+            self.push_seen = True
+            entry = self._entries.get(request_id)
+            if entry is None:
+                if len(self._early) < 1000:
+                    self._early.add(request_id)
+                return
+            if entry["in_flight"]:
+                entry["repoll"] = True  # The poll under way may predate the completion
+            else:
+                entry["due"] = time.monotonic()
+            self._cond.notify()
+
+    def outstanding(self):
+        with self._cond:
+            return len(self._entries)
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    idle = [(entry["due"], request_id) for request_id, entry in self._entries.items()
+                            if not entry["in_flight"]]
+                    wait = None
+                    if idle:
+                        due, request_id = min(idle)
+                        wait = due - time.monotonic()
+                        if wait <= 0:
+                            break
+                    self._cond.wait(wait)
+                entry = self._entries[request_id]
+                entry["in_flight"] = True
+            ratelimit.acquire("eternalai.poll")
+            self._executor.submit(self._poll, request_id, entry)
+
+    def _poll(self, request_id, entry):
+        try:
+            update = self._http.get(f"{POLL_URL}/{request_id}", headers={'x-api-key': entry["api_key"]}, timeout=30)
+            metrics.bytes_downloaded.inc(len(update.content), upstream="eternalai")
+        except Exception as e:
+            update = e
+        with self._cond:
+            entry["in_flight"] = False
+            entry["due"] = time.monotonic() + (0 if entry.pop("repoll", False) else self._next_interval(entry))
+            for watch in entry["watches"]:
+                watch._updates.put(update)
+            self._cond.notify()
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def callback_url():
+    # CALLBACK_URL with this process's token added to the query string
+    parts = urlsplit(CALLBACK_URL)
+    query = "&".join(filter(None, [parts.query, urlencode({"token": CALLBACK_TOKEN})]))
+    return urlunsplit(parts._replace(query=query))
+
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        token = parse_qs(urlsplit(self.path).query).get("token", [""])[0]
+        if not hmac.compare_digest(token, CALLBACK_TOKEN):
+            self.send_error(403)
+            return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            request_id = data.get("request_id") or data.get("id")
+        except (ValueError, AttributeError):
+            request_id = None
+        if not request_id:
+            self.send_error(400)
+            return
+        get_poller().push(request_id)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_callback_server(port=CALLBACK_PORT):
+    # Listen for pushed results on a daemon thread; returns the server, or None when the port is taken
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), _CallbackHandler)
+    except OSError as e:
+        logger.warning("Callback listener not started on port %d, polling instead: %s", port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="callback-server", daemon=True).start()
+    return server
+
+
+def get_poller():
+    # One poller per process, shared by every job; starts the callback listener when CALLBACK_URL is set
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            push_enabled = bool(CALLBACK_URL) and start_callback_server() is not None
+            _poller = Poller(push_enabled=push_enabled)
+        return _poller
+
+
+def _cancel_upstream(api_key, request_id):
+    if not CANCEL_PATH:
+        return
+    try:
+        requests.post(f"{ETERNAL_API_BASE}{CANCEL_PATH.format(request_id=request_id)}",
+                      headers={'x-api-key': api_key}, timeout=10)
+    except requests.RequestException as e:
+        logger.warning("Upstream cancel of %s failed: %s", request_id, e)
+
+
+def _header_number(response, name):
+    try:
+        return float(response.headers.get(name, ""))
+    except ValueError:
+        return None
+
+
+def run_generation(api_key, payload, timer=None, on_status=None, session="headless", cancel=None, record=True):
+    # Submit, poll and download one job. Never raises; the outcome is in result["status"]:
+    # ok / no_url / failed / timeout / rejected / error / cancelled
+    # With api_key=None the job runs on a key from the shared pool (see keypool.py).
+    # Setting the cancel event stops waiting on the job right away (and cancels it upstream
+    # when CANCEL_PATH is configured). record=False leaves the ledger entry to the caller (run_hedged)
+    timer = timer or StageTimer()
+    on_status = on_status or (lambda text: None)
+    cancel = cancel or threading.Event()
+    result = {"status": "error", "request_id": None, "img_url": None, "res_data": None,
+              "size_kb": 0, "dimensions": "Unknown", "error": None, "timings": {}, "polls": 0,
+              "http_status": None, "retry_after": None, "quota_remaining": None,
+              "model_id": payload.get("model_id"), "local_path": None, "sha256": None}
+
+    pooled = api_key is None
+
+    try:
+        if cancel.is_set():  # Cancelled while still queued
+            result["status"] = "cancelled"
+            return result
+        if pooled:
+            on_status("Waiting for an API key...")
+            api_key = get_key_pool().acquire(cancel=cancel)
+            if cancel.is_set():
+                result["status"] = "cancelled"
+                return result
+        if api_key is None:
+            result["status"] = "rejected"
+            result["error"] = "No EternalAI API key available (all keys are out of rotation)"
+            return result
+
+        headers = {
+            'x-api-key': api_key,
+            'Content-Type': 'application/json'
+        }
+
+        on_status("Sending request...")
+        poller = get_poller()
+        body = json.dumps(dict(payload, callback_url=callback_url()) if poller.push_enabled else payload).encode()
+        metrics.bytes_uploaded.inc(len(body), upstream="eternalai")
+        ratelimit.acquire("eternalai.submit")
+        timer.mark("throttle")
+        if cancel.is_set():
+            result["status"] = "cancelled"
+            return result
+        # Bounded: a hung create request would otherwise hold a scheduler slot for good
+        response = requests.post(CREATE_URL, headers=headers, data=body, timeout=SUBMIT_TIMEOUT)
+        timer.mark("submit")
+        result["http_status"] = response.status_code
+        result["retry_after"] = _header_number(response, "Retry-After")
+        remaining = _header_number(response, "X-RateLimit-Remaining")
+        result["quota_remaining"] = int(remaining) if remaining is not None else None
+
+        if response.status_code != 200:
+            result["status"] = "rejected"
+            result["error"] = f"Request failed: {response.text}"
+            return result
+
+        data = response.json()
+        request_id = result["request_id"] = data.get("request_id") or data.get("id")
+        metrics.jobs_submitted.inc(model=payload.get("model_id"))
+
+        # Wait for the shared poller's updates (max 5 minutes)
+        on_status("Processing... (max 5 minutes)")
+        watch = poller.watch(api_key, request_id, expected=get_router().stats(payload.get("model_id"))["p50"])
+        try:
+            deadline = time.monotonic() + POLL_TIMEOUT
+            while time.monotonic() < deadline:
+                if cancel.is_set():
+                    result["status"] = "cancelled"
+                    _cancel_upstream(api_key, request_id)
+                    return result
+                check_res = watch.next(min(deadline - time.monotonic(), 0.5))
+                if check_res is None or cancel.is_set():
+                    continue
+                result["polls"] += 1
+                elapsed = time.monotonic() - timer.marks["submit"]
+
+                if check_res.status_code == 404:
+                    on_status(f"Server preparing... ({elapsed:.0f}s elapsed)")
+                    continue
+                if check_res.status_code != 200:
+                    on_status(f"Communication error: {check_res.status_code}")
+                    continue
+
+                if "queue" not in timer.marks:
+                    timer.mark("queue")
+                res_data = result["res_data"] = check_res.json()
+                status = res_data.get("status")
+
+                if status in DONE_STATUSES:
+                    timer.mark("model")
+                    img_url = extract_image_url(res_data)
+                    if not img_url:
+                        result["status"] = "no_url"
+                        return result
+                    result["img_url"] = img_url
+                    download = download_result(img_url)
+                    result["size_kb"], result["dimensions"] = download["size_kb"], download["dimensions"]
+                    result["local_path"], result["sha256"] = download["path"], download["sha256"]
+                    timer.mark("download")
+                    if download["path"]:
+                        index_stored_image(download["sha256"], download["path"])
+                        trim_local_store(keep=download["path"])
+                    if download["error"]:
+                        on_status(f"Error loading image: {download['error']}")
+                    result["status"] = "ok"
+                    return result
+
+                if status in RUNNING_STATUSES:
+                    on_status(f"Generating... ({elapsed:.0f}s elapsed)")
+                elif status == "failed":
+                    timer.mark("model")
+                    result["status"] = "failed"
+                    return result
+                elif status == "cancelled":
+                    result["status"] = "cancelled"
+                    return result
+        finally:
+            poller.unwatch(watch)
+
+        result["status"] = "timeout"
+        return result
+
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"Error: {e}"
+        return result
+
+    finally:
+        result["timings"] = timer.durations()
+        result["latency"] = timer.upstream_latency()
+        if pooled and api_key:
+            get_key_pool().release(api_key, result)
+        if record:
+            _record(result, payload, session)
+
+
+_hedge_spend = deque()  # [monotonic time, estimated cost] of hedges in the current window
+_hedge_lock = threading.Lock()
+
+
+def _reserve_hedge(model_id):
+    # Book one duplicate image on model_id against HEDGE_SPEND_CAP; returns the booking (for
+    # _refund_hedge), or None when it would not fit in the current window
+    cost = estimate_cost(get_ledger().prices, model_id, images=1)
+    with _hedge_lock:
+        now = time.monotonic()
+        while _hedge_spend and _hedge_spend[0][0] < now - HEDGE_SPEND_WINDOW:
+            _hedge_spend.popleft()
+        if sum(spent for _, spent in _hedge_spend) + cost > HEDGE_SPEND_CAP:
+            return None
+        booking = [now, cost]
+        _hedge_spend.append(booking)
+        return booking
+
+
+def _refund_hedge(booking):
+    # The hedge never got a request_id, so nothing was charged
+    with _hedge_lock:
+        if booking in _hedge_spend:
+            _hedge_spend.remove(booking)
+
+
+def run_hedged(api_key, payload, fallback_model_id=None, timer=None, on_status=None, session="headless",
+               cancel=None, reserve_slot=None):
+    # run_generation, plus a duplicate on fallback_model_id once the job has run longer than its
+    # model's recent p95. The first "ok" result wins and the other job is abandoned; if neither
+    # succeeds the primary's result is returned. result["hedge"] says what happened.
+    # reserve_slot: the scheduler's JobScheduler.reserve_slot, so the duplicate counts against
+    # MAX_IN_FLIGHT (and is skipped while the job queue is full); without it hedges are not limited
+    timer = timer or StageTimer()
+    on_status = on_status or (lambda text: None)
+    cancel = cancel or threading.Event()
+    threshold = get_router().stats(payload.get("model_id"))["p95"]
+    if not fallback_model_id or fallback_model_id == payload.get("model_id") or threshold is None:
+        return run_generation(api_key, payload, timer, on_status, session, cancel)
+
+    finished = queue.Queue()
+    cancels = {"primary": threading.Event(), "hedge": threading.Event()}
+    abandoned = set()  # Attempts that lost the race (cancelled by us, not by the user)
+
+    def attempt(name, job_payload, job_timer, job_on_status, release=None, booking=None):
+        try:
+            result = run_generation(api_key, job_payload, job_timer, job_on_status, session, cancels[name],
+                                    record=False)
+            _record(result, job_payload, session, hedge_loser=name in abandoned)
+            if booking is not None and not result["request_id"]:
+                _refund_hedge(booking)
+            finished.put((name, result))
+        finally:
+            if release is not None:
+                release()
+
+    threading.Thread(target=attempt, args=("primary", payload, timer, on_status),
+                     name="hedge-primary", daemon=True).start()
+    started = {"primary"}
+    results = {}
+    winner = None
+    while winner is None:
+        if cancel.is_set():
+            for event in cancels.values():
+                event.set()
+        try:
+            name, result = finished.get(timeout=0.5)
+        except queue.Empty:
+            # Compared from the primary's POST, like the p95 itself (a job still queued here is not slow upstream)
+            running = timer.upstream_latency()
+            if "hedge" in started or running is None or running <= threshold or cancel.is_set():
+                continue
+            release = reserve_slot() if reserve_slot else (lambda: None)
+            if release is None:
+                continue  # No free slot: try again on the next tick
+            booking = _reserve_hedge(fallback_model_id)
+            if booking is None:
+                release()
+                continue
+            hedge_timer = StageTimer()
+            hedge_timer.mark("encode")
+            started.add("hedge")
+            on_status(f"Past p95 ({threshold:.0f}s): also trying {fallback_model_id}...")
+            threading.Thread(
+                target=attempt,
+                args=("hedge", dict(payload, model_id=fallback_model_id), hedge_timer,
+                      lambda text: on_status(f"[{fallback_model_id}] {text}"), release, booking),
+                name="hedge-fallback", daemon=True
+            ).start()
+            continue
+        results[name] = result
+        if result["status"] == "ok":
+            winner = name
+        elif len(results) == len(started):
+            # Everything started has finished without success (a primary that fails early is not hedged)
+            winner = "primary"
+
+    for name in started - set(results):
+        abandoned.add(name)
+        cancels[name].set()  # Abandon the slower job
+    result = results[winner]
+    if "hedge" in started:
+        result["hedge"] = {"model_id": fallback_model_id, "after_s": round(threshold, 1), "winner": winner}
+    return result
+
+
+def _record(result, payload, session, hedge_loser=False):
+    # Usage ledger entry, metrics and one structured log line per job.
+    # A hedge loser that was already submitted is still paid for: it is booked as "hedge_loser"
+    # at one image's estimated cost, the same amount _reserve_hedge counts against the cap
+    timings = result["timings"]
+    model_id = payload.get("model_id")
+    status = result["status"]
+    if hedge_loser and result["request_id"] and status == "cancelled":
+        status = "hedge_loser"
+    if result["status"] == "ok":
+        metrics.jobs_completed.inc(model=model_id)
+    else:
+        metrics.jobs_failed.inc(model=model_id, reason=status)
+    if result["request_id"]:
+        metrics.job_polls.observe(result["polls"], model=model_id)
+        metrics.job_latency.observe(timings["total"], model=model_id)
+    if "queue" in timings:
+        metrics.job_queue_wait.observe(timings["queue"], model=model_id)
+
+    latency = result.get("latency") or 0.0  # POST to completion, without local queue / throttle waits
+    # Jobs the model actually saw and finished ("rejected" / "cancelled" say nothing about the model)
+    if result["request_id"] and result["status"] != "cancelled":
+        get_router().observe(model_id, result["status"] == "ok", latency)
+    get_ledger().record(
+        "generation", payload.get("model_id"), session, latency,
+        status=status, images=1 if status in ("ok", "hedge_loser") else 0,
+        request_id=result["request_id"], stages=timings
+    )
+    logger.info(json.dumps({
+        "event": "generation",
+        "session": session,
+        "model": payload.get("model_id"),
+        "request_id": result["request_id"],
+        "status": status,
+        "polls": result["polls"],
+        "stages": timings
+    }))
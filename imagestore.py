@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import struct
+import hashlib
+import tempfile
+import requests
+import metrics
+
+# Local copies of generated images, content-addressed: <dir>/<sha256[:2]>/<sha256>.<ext>
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", "image_store")
+MAX_RESULT_BYTES = int(os.environ.get("MAX_RESULT_BYTES", str(50 * 1024 * 1024)))
+# Optional retention (0 = keep everything): oldest copies are deleted beyond this total size / age
+IMAGE_STORE_MAX_MB = float(os.environ.get("IMAGE_STORE_MAX_MB", "0"))
+IMAGE_STORE_MAX_DAYS = float(os.environ.get("IMAGE_STORE_MAX_DAYS", "0"))
+CHUNK_SIZE = 64 * 1024
+HEADER_BYTES = 256 * 1024  # Give up looking for dimensions after this much
+
+
+def image_info(head):
+    # (format, width, height) from the first bytes of a PNG / JPEG / WebP / GIF, or None if more
+    # bytes are needed or the format is unknown
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(head) >= 24:
+            width, height = struct.unpack(">II", head[16:24])
+            return "png", width, height
+        return None
+    if head.startswith(b"GIF8"):
+        if len(head) >= 10:
+            width, height = struct.unpack("<HH", head[6:10])
+            return "gif", width, height
+        return None
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        chunk = head[12:16]
+        if chunk == b"VP8 " and len(head) >= 30:
+            width, height = struct.unpack("<HH", head[26:30])
+            return "webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and len(head) >= 25:
+            bits = int.from_bytes(head[21:25], "little")
+            return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X" and len(head) >= 30:
+            return "webp", int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+        return None
+    if head.startswith(b"\xff\xd8"):
+        # Walk the JPEG segments up to the first start-of-frame marker
+        offset = 2
+        while offset + 9 <= len(head):
+            if head[offset] != 0xFF:
+                return None
+            marker = head[offset + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                offset += 2
+                continue
+            length = struct.unpack(">H", head[offset + 2:offset + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", head[offset + 5:offset + 9])
+                return "jpeg", width, height
+            offset += 2 + length
+        return None
+    return None
+
+
+def download_to_store(url, store_dir=IMAGE_STORE_DIR, max_bytes=MAX_RESULT_BYTES, timeout=60):
+    # Stream url into the store chunk by chunk, hashing as it goes; memory use does not depend
+    # on the image size. Returns {"path", "sha256", "bytes", "format", "width", "height"};
+    # raises ValueError when the image is larger than max_bytes
+    os.makedirs(store_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    head = b""
+    info = None
+    size = 0
+    handle, temp_path = tempfile.mkstemp(dir=store_dir, suffix=".part")
+    try:
+        with os.fdopen(handle, "wb") as f, requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            declared = int(response.headers.get("Content-Length") or 0)
+            if declared > max_bytes:
+                raise ValueError(f"Result is {declared / 1024 / 1024:.1f} MB, over the {max_bytes / 1024 / 1024:.1f} MB limit")
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Result is over the {max_bytes / 1024 / 1024:.1f} MB limit")
+                digest.update(chunk)
+                f.write(chunk)
+                metrics.bytes_downloaded.inc(len(chunk), upstream="image")
+                if info is None and len(head) < HEADER_BYTES:
+                    head += chunk[:HEADER_BYTES - len(head)]
+                    info = image_info(head)
+
+        sha256 = digest.hexdigest()
+        image_format, width, height = info or ("bin", None, None)
+        path = os.path.join(store_dir, sha256[:2], f"{sha256}.{image_format}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)  # Same content, same name: re-downloads just overwrite
+        return {"path": path, "sha256": sha256, "bytes": size, "format": image_format,
+                "width": width, "height": height}
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def trim_store(store_dir=IMAGE_STORE_DIR, max_mb=IMAGE_STORE_MAX_MB, max_days=IMAGE_STORE_MAX_DAYS, keep=None):
+    # Delete stored images older than max_days, then the oldest ones until the store is within
+    # max_mb (0 disables either limit; `keep` is never deleted). Returns the sha256s removed
+    if not max_mb and not max_days:
+        return []
+    files = []
+    try:
+        for folder in os.scandir(store_dir):
+            if not folder.is_dir() or len(folder.name) != 2:
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.is_file() and not entry.name.endswith(".part"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return []
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    cutoff = time.time() - max_days * 86400 if max_days else None
+    removed = []
+    for mtime, size, path in files:
+        too_old = cutoff is not None and mtime < cutoff
+        too_big = max_mb and total > max_mb * 1024 * 1024
+        if not (too_old or too_big):
+            break  # Oldest first: everything after this is newer and fits
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed.append(os.path.splitext(os.path.basename(path))[0])
+    return removed
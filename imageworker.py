@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import base64
+import logging
+import threading
+import multiprocessing
+import uuid
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+# CPU-bound image work (PIL decode / resize / encode, base64) runs in a process pool shared by
+# every session, so a large image no longer holds the GIL of the Streamlit server.
+# IMAGE_WORKERS=0 runs the work inline on the calling thread instead (the default on a single
+# core, where a pool only adds pickling overhead).
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+IMAGE_TASK_TIMEOUT = float(os.environ.get("IMAGE_TASK_TIMEOUT", "60"))
+
+logger = logging.getLogger("imageworker")
+
+
+# --- Tasks (run in the worker processes: plain functions of bytes, importable by name) ---
+
+def encode_image(data, max_size=(1024, 1024)):
+    # Reference image bytes -> (data URL, encoded size in bytes), downscaled to fit max_size
+    from PIL import Image
+
+    image = Image.open(BytesIO(data))
+    image_format = image.format if image.format else 'PNG'
+    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    buffered = BytesIO()
+    image.save(buffered, format=image_format, quality=85)
+    img_bytes = buffered.getvalue()
+    return f"data:image/{image_format.lower()};base64,{base64.b64encode(img_bytes).decode()}", len(img_bytes)
+
+
+def preview_image(data, max_width=730):
+    # Image bytes -> JPEG bytes no wider than max_width, for on-page previews
+    from PIL import Image
+
+    image = Image.open(BytesIO(data))
+    image.thumbnail((max_width, max_width * 4), Image.Resampling.LANCZOS)
+    buffered = BytesIO()
+    image.convert("RGB").save(buffered, format="JPEG", quality=90)
+    return buffered.getvalue()
+
+
+def perceptual_hash(path):
+    # Stored image -> (dHash, pHash) as 64-bit ints (see similarity.py)
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.draft("L", (64, 64))  # JPEG: decode at reduced size
+        gray = image.convert("L")
+    # dHash: is each pixel brighter than its right neighbour, on a 9x8 thumbnail
+    pixels = np.asarray(gray.resize((9, 8), Image.Resampling.BOX), dtype=np.float32)
+    dhash = pixels[:, 1:] > pixels[:, :-1]
+    # pHash: low 8x8 frequencies of the 32x32 thumbnail's DCT, above / below their median
+    # (the DC term is left out of the median, it only reflects overall brightness)
+    pixels = np.asarray(gray.resize((32, 32), Image.Resampling.BOX), dtype=np.float64)
+    n = np.arange(32)
+    dct_matrix = np.cos(np.pi * np.outer(n[:8], 2 * n + 1) / 64)
+    low = dct_matrix @ pixels @ dct_matrix.T
+    phash = low > np.median(low.flatten()[1:])
+    return tuple(int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big") for bits in (dhash, phash))
+
+
+def build_sprite_sheet(paths, out_path, thumb, columns, rows, base_path=None, start=0):
+    # Paste thumbnails of paths into cells start, start+1, ... of a columns x rows sheet and save it
+    # as JPEG. Extending a page passes the previous sheet as base_path, so only new cells are drawn
+    # (re-encoding the old cells at the same quality on the same 8px grid barely changes them)
+    from PIL import Image
+
+    if base_path:
+        with Image.open(base_path) as base:
+            sheet = base.convert("RGB")
+    else:
+        sheet = Image.new("RGB", (columns * thumb, rows * thumb), "#0E1117")
+    for cell, path in enumerate(paths, start):
+        try:
+            with Image.open(path) as image:
+                image.draft("RGB", (thumb, thumb))
+                image.thumbnail((thumb, thumb), Image.Resampling.LANCZOS, reducing_gap=2.0)
+                image = image.convert("RGB")
+        except OSError:
+            continue  # Missing or unreadable copy: leave the cell blank
+        x = (cell % columns) * thumb + (thumb - image.width) // 2
+        y = (cell // columns) * thumb + (thumb - image.height) // 2
+        sheet.paste(image, (x, y))
+    temp_path = f"{out_path}.{uuid.uuid4().hex[:8]}.part"  # Two sessions may build the same page at once
+    sheet.save(temp_path, format="JPEG", quality=85)
+    os.replace(temp_path, out_path)
+    return out_path
+
+
+# --- Pool ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_image_pool():
+    # One pool per process, started on first use; None when IMAGE_WORKERS=0
+    global _pool
+    with _pool_lock:
+        if _pool is None and IMAGE_WORKERS > 0:
+            # spawn, not fork: forking the multi-threaded Streamlit server can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool(pool):
+    # A worker died (e.g. killed while decoding a huge image): start a fresh pool next time
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_image_task(task, *args, timeout=IMAGE_TASK_TIMEOUT):
+    # Run task(*args) in the image pool and wait for its result; the caller's thread only waits,
+    # so other sessions keep running. Exceptions raised by the task are re-raised here
+    start = time.monotonic()
+    pool = get_image_pool()
+    try:
+        if pool is None:
+            return task(*args)
+        try:
+            return pool.submit(task, *args).result(timeout=timeout)
+        except BrokenProcessPool:
+            logger.warning("Image worker pool broke while running %s; restarting it", task.__name__)
+            _reset_pool(pool)
+            raise RuntimeError("Image worker crashed (image too large?)")
+    finally:
+        metrics.image_task_seconds.observe(time.monotonic() - start, task=task.__name__)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import hashlib
+import logging
+import threading
+
+# A key is taken out of rotation after this many consecutive failures, for KEY_COOLDOWN seconds
+KEY_MAX_FAILURES = 3
+KEY_COOLDOWN = float(os.environ.get("KEY_COOLDOWN", "120"))
+# Rejected as invalid (401/403) or out of credit (402): out of rotation for much longer
+KEY_EXHAUSTED_COOLDOWN = 3600
+# When every key is out of rotation, a job waits this long for the first one to come back
+KEY_WAIT_TIMEOUT = float(os.environ.get("KEY_WAIT_TIMEOUT", "60"))
+
+logger = logging.getLogger("keypool")
+
+
+def key_id(key):
+    # Short, stable label for logs and the UI; never show the key itself
+    return hashlib.sha256(key.encode()).hexdigest()[:8]
+
+
+def load_keys(path=None):
+    # ETERNAL_API_KEYS="key1,key2" (pool) > ETERNAL_API_KEY (single) > file with one key per line
+    raw = os.environ.get("ETERNAL_API_KEYS") or os.environ.get("ETERNAL_API_KEY")
+    if not raw and path:
+        try:
+            with open(path, "r") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raw = ""
+    keys = []
+    for key in (raw or "").replace("\n", ",").split(","):
+        key = key.strip()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+class KeyPool:
+    # Hands out the least-loaded healthy EternalAI key (fewest jobs in flight, then fewest
+    # recent failures) and takes keys out of rotation when they fail or run out of quota.
+    def __init__(self, keys):
+        self._lock = threading.Lock()
+        self._state = {key: {"in_flight": 0, "failures": 0, "jobs": 0, "errors": 0,
+                             "remaining": None, "disabled_until": 0.0, "reason": None}
+                       for key in keys}
+
+    @property
+    def keys(self):
+        return list(self._state)
+
+    def acquire(self, timeout=KEY_WAIT_TIMEOUT, cancel=None):
+        # A key for one job. When every key is out of rotation, waits for the first one to come
+        # back (e.g. after a 429's Retry-After); None if that is more than timeout away or the
+        # cancel event is set meanwhile
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if not self._state:
+                    return None
+                healthy = [key for key, state in self._state.items() if state["disabled_until"] <= now]
+                if healthy:
+                    key = min(healthy, key=lambda key: (self._state[key]["in_flight"], self._state[key]["failures"]))
+                    self._state[key]["in_flight"] += 1
+                    self._state[key]["jobs"] += 1
+                    return key
+                back_at = min(state["disabled_until"] for state in self._state.values())
+            if back_at > deadline:
+                return None
+            if cancel is not None:
+                if cancel.wait(back_at - now):
+                    return None
+            else:
+                time.sleep(back_at - now)
+
+    def release(self, key, result):
+        # Update the key's health from run_generation's result
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                return
+            state["in_flight"] -= 1
+            if result.get("quota_remaining") is not None:
+                state["remaining"] = result["quota_remaining"]
+
+            status_code = result.get("http_status")
+            if result["status"] not in ("rejected", "error"):
+                state["failures"] = 0
+                if state["remaining"] == 0:
+                    self._disable(key, state, KEY_COOLDOWN, "quota exhausted")
+                return
+
+            state["errors"] += 1
+            if status_code in (401, 402, 403):
+                self._disable(key, state, KEY_EXHAUSTED_COOLDOWN, f"HTTP {status_code}")
+            elif status_code == 429:
+                # Throttled, not broken: sit out the Retry-After without counting a failure
+                self._disable(key, state, result.get("retry_after") or 30, "rate limited")
+            elif status_code is None or status_code >= 500:
+                # Server errors and network failures (no response) may be the key's account
+                state["failures"] += 1
+                if state["failures"] >= KEY_MAX_FAILURES:
+                    self._disable(key, state, KEY_COOLDOWN, f"{state['failures']} consecutive failures")
+            # Other 4xx (bad prompt, oversized reference...) and errors after an accepted submit
+            # say nothing about the key
+
+    def _disable(self, key, state, seconds, reason):
+        state["disabled_until"] = time.monotonic() + seconds
+        state["failures"] = 0  # Gets a clean slate when it comes back
+        state["reason"] = reason
+        logger.warning("API key %s out of rotation for %.0fs: %s", key_id(key), seconds, reason)
+
+    def snapshot(self):
+        # Per-key status rows for display (keys shown as short hashes)
+        with self._lock:
+            now = time.monotonic()
+            return [{
+                "key": key_id(key),
+                "in_flight": state["in_flight"],
+                "jobs": state["jobs"],
+                "errors": state["errors"],
+                "remaining": state["remaining"] if state["remaining"] is not None else "-",
+                "status": f"out ({state['reason']}, {state['disabled_until'] - now:.0f}s)"
+                          if state["disabled_until"] > now else "ok"
+            } for key, state in self._state.items()]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool(path=None):
+    # One pool per process, loaded on first use (see load_keys)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = KeyPool(load_keys(path))
+        return _pool
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import threading
+import datetime
+
+# Local usage ledger (one JSON record per call)
+LEDGER_PATH = os.environ.get("LEDGER_PATH", "usage_ledger.jsonl")
+
+# Approximate prices in USD, used when the provider does not report a cost.
+# Translation: per 1M tokens (prompt / completion). Generation: per image.
+# Override or extend with LEDGER_PRICES='{"model-id": {"per_image": 0.05}}'
+DEFAULT_PRICES = {
+    "nousresearch/hermes-3-llama-3.1-405b": {"prompt": 0.80, "completion": 0.80},
+    "deepseek/deepseek-chat": {"prompt": 0.30, "completion": 0.85},
+    "Qwen-Image-Edit-2509": {"per_image": 0.03},
+    "gemini-3-pro-image-preview": {"per_image": 0.134},
+    "gemini-2.5-flash-image": {"per_image": 0.039},
+    "seedream-4-5-251128": {"per_image": 0.04},
+    "flux-2-pro": {"per_image": 0.03}
+}
+
+
+def load_prices():
+    prices = dict(DEFAULT_PRICES)
+    raw = os.environ.get("LEDGER_PRICES", "").strip()
+    if raw:
+        try:
+            prices.update(json.loads(raw))
+        except ValueError:
+            pass
+    return prices
+
+
+def estimate_cost(prices, model_id, prompt_tokens=0, completion_tokens=0, images=0):
+    price = prices.get(model_id, {})
+    return (prompt_tokens * price.get("prompt", 0.0) / 1_000_000
+            + completion_tokens * price.get("completion", 0.0) / 1_000_000
+            + images * price.get("per_image", 0.0))
+
+
+def _empty_rollup():
+    return {"calls": 0, "errors": 0, "tokens": 0, "cost": 0.0, "latency_total": 0.0, "latency_max": 0.0}
+
+
+class Ledger:
+    # Append-only JSONL ledger with running per-model / per-session totals
+    def __init__(self, path=LEDGER_PATH, prices=None):
+        self.path = path
+        self.prices = prices if prices is not None else load_prices()
+        self._lock = threading.Lock()
+        self.total_cost = 0.0
+        self.by_model = {}
+        self.by_session = {}
+        self._replay()
+
+    def _replay(self):
+        # Rebuild the totals once from disk; afterwards they are updated per record
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self._apply(json.loads(line))
+                except ValueError:
+                    continue
+
+    def _apply(self, record):
+        self.total_cost += record.get("cost", 0.0)
+        for rollups, key in ((self.by_model, record.get("model")), (self.by_session, record.get("session"))):
+            rollup = rollups.setdefault(key, _empty_rollup())
+            rollup["calls"] += 1
+            rollup["errors"] += 1 if record.get("status") not in ("ok", "hedge_loser") else 0
+            rollup["tokens"] += record.get("total_tokens", 0)
+            rollup["cost"] += record.get("cost", 0.0)
+            rollup["latency_total"] += record.get("latency", 0.0)
+            rollup["latency_max"] = max(rollup["latency_max"], record.get("latency", 0.0))
+
+    def record(self, kind, model, session, latency, status="ok", prompt_tokens=0,
+               completion_tokens=0, images=0, cost=None, **extra):
+        # kind: "translation" or "generation"; cost=None estimates from the price table
+        if cost is None:
+            cost = estimate_cost(self.prices, model, prompt_tokens, completion_tokens, images)
+        record = {
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "kind": kind,
+            "model": model,
+            "session": session,
+            "status": status,
+            "latency": round(latency, 3),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "images": images,
+            "cost": cost
+        }
+        record.update(extra)
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError:
+                pass  # Read-only filesystem: keep the in-memory totals only
+            self._apply(record)
+        return record
+
+    def session_cost(self, session):
+        with self._lock:
+            return self.by_session.get(session, _empty_rollup())["cost"]
+
+    def model_rollups(self):
+        # Rows for display, cheapest average cost first
+        with self._lock:
+            rows = [
+                {
+                    "model": model,
+                    "calls": rollup["calls"],
+                    "errors": rollup["errors"],
+                    "tokens": rollup["tokens"],
+                    "cost": round(rollup["cost"], 4),
+                    "cost/call": round(rollup["cost"] / rollup["calls"], 4),
+                    "avg latency (s)": round(rollup["latency_total"] / rollup["calls"], 2),
+                    "max latency (s)": round(rollup["latency_max"], 2)
+                }
+                for model, rollup in self.by_model.items()
+            ]
+        return sorted(rows, key=lambda row: row["cost/call"])
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    # Process-wide ledger shared by all sessions
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = Ledger()
+        return _ledger
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import os
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Side port for the Prometheus text endpoint (0 disables it)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150)
+
+logger = logging.getLogger("metrics")
+
+
+def _label_text(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text(self.label_names, key, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names, key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_label_text(self.label_names, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_label_text(self.label_names, key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Generation traffic
+jobs_submitted = registry.register(Counter(
+    "eternal_jobs_submitted_total", "Generation jobs submitted to EternalAI", ["model"]))
+jobs_completed = registry.register(Counter(
+    "eternal_jobs_completed_total", "Generation jobs that returned an image", ["model"]))
+jobs_failed = registry.register(Counter(
+    "eternal_jobs_failed_total", "Generation jobs that ended without an image", ["model", "reason"]))
+job_polls = registry.register(Histogram(
+    "eternal_job_polls", "Poll requests per generation job", ["model"], buckets=COUNT_BUCKETS))
+job_queue_wait = registry.register(Histogram(
+    "eternal_job_queue_wait_seconds", "Time from submit until the job leaves 'Server preparing'", ["model"]))
+push_callbacks = registry.register(Counter(
+    "eternal_push_callbacks_total", "Job results pushed to the callback listener"))
+job_latency = registry.register(Histogram(
+    "eternal_job_latency_seconds", "End-to-end generation latency (encode to downloaded result)", ["model"]))
+
+# Translation traffic
+translations = registry.register(Counter(
+    "openrouter_translations_total", "Translation requests to OpenRouter", ["model", "status"]))
+translation_latency = registry.register(Histogram(
+    "openrouter_translation_latency_seconds", "Translation request latency", ["model"]))
+
+# Bytes on the wire
+bytes_uploaded = registry.register(Counter(
+    "eternal_bytes_uploaded_total", "Request body bytes sent upstream", ["upstream"]))
+bytes_downloaded = registry.register(Counter(
+    "eternal_bytes_downloaded_total", "Response body bytes received from upstream", ["upstream"]))
+
+# Image work in the process pool (see imageworker.py)
+image_task_seconds = registry.register(Histogram(
+    "eternal_image_task_seconds", "Time from submitting an image task to its result, including pool queueing",
+    ["task"]))
+
+
+# Outbound rate limiting (see ratelimit.py)
+rate_limit_wait = registry.register(Histogram(
+    "eternal_rate_limit_wait_seconds", "Time a request waited for its rate limit token", ["bucket"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)))
+rate_limit_rejected = registry.register(Counter(
+    "eternal_rate_limit_rejected_total", "Requests dropped because no token was available before their deadline",
+    ["bucket"]))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the app log
+
+
+def start_metrics_server(port=METRICS_PORT):
+    # Serve /metrics on a daemon thread; returns the server, or None when disabled / port taken
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:
+        logger.warning("Metrics endpoint not started on port %d: %s", port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import threading
+import metrics
+
+# Outbound request budgets shared by every session: requests per second and burst size,
+# per upstream endpoint. Override with RATE_LIMITS='{"eternalai.submit": {"rate": 1, "burst": 3}}'
+# (rate 0 disables a limit)
+DEFAULT_LIMITS = {
+    "eternalai.submit": {"rate": 2.0, "burst": 5},
+    "eternalai.poll": {"rate": float(os.environ.get("POLL_QPS", "10")), "burst": 10},
+    "openrouter.chat": {"rate": 5.0, "burst": 10},
+    "openrouter.credits": {"rate": 1.0, "burst": 2}
+}
+
+
+def load_limits():
+    limits = {name: dict(limit) for name, limit in DEFAULT_LIMITS.items()}
+    raw = os.environ.get("RATE_LIMITS", "").strip()
+    if raw:
+        try:
+            for name, limit in json.loads(raw).items():
+                limits.setdefault(name, {"rate": 0.0, "burst": 1}).update(limit)
+        except (ValueError, AttributeError):
+            pass
+    return limits
+
+
+class TokenBucket:
+    # Tokens refill at `rate` per second up to `burst`. A caller that finds the bucket empty
+    # reserves the next token (the balance goes negative) and sleeps until it is due, so
+    # waiting callers are served in arrival order and a burst is spread out, not rejected.
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout=None):
+        # Seconds to wait for a token, or None when that would exceed timeout (nothing reserved)
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return None
+            self.tokens -= 1
+            return wait
+
+    def acquire(self, timeout=None):
+        wait = self.reserve(timeout)
+        if wait:
+            time.sleep(wait)
+        return wait is not None
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(name):
+    with _buckets_lock:
+        if name not in _buckets:
+            limit = load_limits().get(name, {"rate": 0.0})
+            _buckets[name] = TokenBucket(limit.get("rate", 0.0), int(limit.get("burst", 1)))
+        return _buckets[name]
+
+
+def acquire(name, timeout=None):
+    # Block until the named endpoint may send one request; False if that takes longer than timeout
+    start = time.monotonic()
+    acquired = get_bucket(name).acquire(timeout)
+    if acquired:
+        metrics.rate_limit_wait.observe(time.monotonic() - start, bucket=name)
+    else:
+        metrics.rate_limit_rejected.inc(bucket=name)
+    return acquired
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import threading
+from collections import deque
+
+# Rolling window of our own job outcomes per model
+ROUTING_WINDOW = int(os.environ.get("ROUTING_WINDOW", "50"))       # jobs per model
+ROUTING_MAX_AGE = float(os.environ.get("ROUTING_MAX_AGE", "1800"))  # seconds
+
+# Assumed for a model without recent jobs ("typically 45s-1min"), so untried models still get picked
+PRIOR_LATENCY = 60.0
+MIN_SAMPLES = 3
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class ModelRouter:
+    # Picks the model expected to return soonest: blend of p50 and p95 completion time over
+    # the recent window, divided by the success rate (a model failing half its jobs costs
+    # about two attempts)
+    def __init__(self, window=ROUTING_WINDOW, max_age=ROUTING_MAX_AGE):
+        self.window = window
+        self.max_age = max_age
+        self._samples = {}  # model_id -> deque of (timestamp, ok, latency)
+        self._lock = threading.Lock()
+
+    def observe(self, model_id, ok, latency):
+        with self._lock:
+            self._samples.setdefault(model_id, deque(maxlen=self.window)).append((time.monotonic(), ok, latency))
+
+    def stats(self, model_id):
+        cutoff = time.monotonic() - self.max_age
+        with self._lock:
+            samples = [sample for sample in self._samples.get(model_id, ()) if sample[0] >= cutoff]
+        latencies = [latency for _, ok, latency in samples if ok]
+        if len(samples) < MIN_SAMPLES:
+            return {"jobs": len(samples), "p50": None, "p95": None,
+                    "success_rate": sum(ok for _, ok, _ in samples) / len(samples) if samples else None,
+                    "score": PRIOR_LATENCY}
+        success_rate = len(latencies) / len(samples)
+        if not latencies:
+            # Every recent job failed: only picked when nothing else qualifies, until the failures age out
+            return {"jobs": len(samples), "p50": None, "p95": None, "success_rate": 0.0, "score": float("inf")}
+        p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+        return {"jobs": len(samples), "p50": p50, "p95": p95, "success_rate": success_rate,
+                "score": (p50 + p95) / 2 / max(success_rate, 0.05)}
+
+    def choose(self, models, capabilities, has_reference, min_tier=1):
+        # models: short name -> model_id. Returns (short name, stats of the pick), or (None, None)
+        # when no model satisfies the constraints
+        mode = "image_to_image" if has_reference else "text_to_image"
+        candidates = [short for short in models
+                      if capabilities.get(short, {}).get(mode) and capabilities[short].get("tier", 1) >= min_tier]
+        if not candidates:
+            return None, None
+        scored = [(self.stats(models[short]), short) for short in candidates]
+        stats, short = min(scored, key=lambda item: item[0]["score"])
+        return short, stats
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    # One router per process; every job's outcome feeds it (generation._record)
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
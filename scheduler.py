@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import uuid
+import threading
+from collections import deque
+from generation import StageTimer, run_hedged
+
+# Generation jobs in flight across all sessions (they share the EternalAI key pool)
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", "4"))
+
+# Finished jobs are kept this long for their session to pick up
+FINISHED_TTL = 600
+
+
+class Job:
+    def __init__(self, session, api_key, payload, priority=0, timer=None, meta=None, fallback_model_id=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.session = session
+        self.api_key = api_key
+        self.payload = payload
+        self.priority = priority
+        self.fallback_model_id = fallback_model_id  # Hedge target once the job passes its model's p95
+        self.cancel = threading.Event()
+        self.timer = timer or StageTimer()
+        self.meta = meta or {}
+        self.state = "queued"  # queued / running / finished
+        self.status_text = "Waiting in queue..."
+        self.result = None
+        self.submitted = time.monotonic()
+        self.finished = None
+
+    def set_status(self, text):
+        self.status_text = text
+
+
+class JobScheduler:
+    # Process-wide queue for generation jobs from every session.
+    # At most max_in_flight jobs run at once; the next job comes from the highest priority
+    # present, and among sessions at that priority the one served least recently goes first
+    # (round-robin), so one user queuing many jobs cannot starve the others.
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, runner=run_hedged):
+        self.max_in_flight = max(1, max_in_flight)
+        self.runner = runner
+        self._queues = {}        # session -> deque of queued jobs, highest priority first
+        self._turns = []         # sessions with queued jobs, in arrival order
+        self._served = {}        # session -> tick of its last dispatched job
+        self._tick = 0
+        self._jobs = {}
+        self._running = 0
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def submit(self, session, api_key, payload, priority=0, timer=None, meta=None, fallback_model_id=None):
+        job = Job(session, api_key, payload, priority, timer, meta, fallback_model_id)
+        with self._cond:
+            self._prune()
+            queue = self._queues.setdefault(session, deque())
+            # Keep each session's queue ordered by priority, FIFO within a priority
+            index = len(queue)
+            while index > 0 and queue[index - 1].priority < priority:
+                index -= 1
+            queue.insert(index, job)
+            if session not in self._turns:
+                self._turns.append(session)
+            self._jobs[job.id] = job
+            self._start_workers()
+            self._cond.notify()
+        return job
+
+    def cancel(self, job_id):
+        # Running jobs stop polling within a moment and free their worker; queued jobs leave the
+        # queue now. Either way the job finishes as "cancelled" (and is recorded in the ledger)
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state == "finished":
+                return job
+            job.cancel.set()
+            if job.state != "queued":
+                return job
+            queue = self._queues[job.session]
+            queue.remove(job)
+            if not queue:
+                del self._queues[job.session]
+                self._turns.remove(job.session)
+            job.state = "running"
+            job.status_text = "Cancelling..."
+        self._finish(job)
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        # Jobs that will be dispatched before this one (0 = next); None once it has left the queue
+        with self._cond:
+            if job.state != "queued":
+                return None
+            return self._dispatch_order().index(job)
+
+    def reserve_slot(self):
+        # An extra in-flight slot for a hedge (generation.run_hedged), taken only when one is free
+        # and no job is waiting for it. Returns the function that gives it back, or None
+        with self._cond:
+            if self._running >= self.max_in_flight or self._turns:
+                return None
+            self._running += 1
+        return self._release_slot
+
+    def _release_slot(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "running": self._running,
+                "max_in_flight": self.max_in_flight
+            }
+
+    def _dispatch_order(self):
+        # Replay _next_job on copies to get the order queued jobs will run in
+        queues = {session: deque(queue) for session, queue in self._queues.items()}
+        turns = list(self._turns)
+        served = dict(self._served)
+        order = []
+        tick = self._tick
+        while turns:
+            tick += 1
+            order.append(self._pick(queues, turns, served, tick))
+        return order
+
+    @staticmethod
+    def _pick(queues, turns, served, tick):
+        top = max(queues[session][0].priority for session in turns)
+        candidates = [session for session in turns if queues[session][0].priority == top]
+        session = min(candidates, key=lambda session: served.get(session, 0))
+        job = queues[session].popleft()
+        served[session] = tick
+        if not queues[session]:
+            del queues[session]
+            turns.remove(session)
+        return job
+
+    def _next_job(self):
+        self._tick += 1
+        job = self._pick(self._queues, self._turns, self._served, self._tick)
+        job.state = "running"
+        job.status_text = "Sending request..."
+        job.timer.mark("dispatch")  # Time spent in this queue, kept apart from the submit itself
+        self._running += 1
+        return job
+
+    def _start_workers(self):
+        while len(self._workers) < self.max_in_flight:
+            worker = threading.Thread(target=self._work, name=f"job-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                # Hedges hold slots too (reserve_slot), so a worker can be idle while others run
+                while not self._turns or self._running >= self.max_in_flight:
+                    self._cond.wait()
+                job = self._next_job()
+            try:
+                self._finish(job)
+            finally:
+                self._release_slot()
+
+    def _finish(self, job):
+        try:
+            job.result = self.runner(job.api_key, job.payload, fallback_model_id=job.fallback_model_id,
+                                     timer=job.timer, on_status=job.set_status, session=job.session,
+                                     cancel=job.cancel, reserve_slot=self.reserve_slot)
+        finally:
+            with self._cond:
+                job.state = "finished"
+                job.finished = time.monotonic()
+
+    def _prune(self):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and now - job.finished > FINISHED_TTL]:
+            del self._jobs[job_id]
+        # Forget turn history of sessions that have been idle for a long while
+        self._served = {session: tick for session, tick in self._served.items()
+                        if session in self._queues or tick > self._tick - 1000}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    # One scheduler per process, shared by every session
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler()
+        return _scheduler
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import json
+import logging
+import threading
+from imagestore import IMAGE_STORE_DIR, trim_store
+from imageworker import perceptual_hash, run_image_task
+
+# Perceptual hashes of the images in the local store (one JSON record per image, replayed on start)
+HASH_INDEX_PATH = os.environ.get("HASH_INDEX_PATH", os.path.join(IMAGE_STORE_DIR, "hashes.jsonl"))
+# Hamming distances out of 64 bits. Near-duplicates must be this close on both dHash and pHash;
+# "find similar" ranks by pHash and stops at SIMILAR_DISTANCE
+DUPLICATE_DISTANCE = int(os.environ.get("DUPLICATE_DISTANCE", "6"))
+SIMILAR_DISTANCE = int(os.environ.get("SIMILAR_DISTANCE", "20"))
+STORE_TRIM_INTERVAL = 60  # seconds between retention passes over the store (see imagestore.trim_store)
+
+logger = logging.getLogger("similarity")
+
+
+class HashIndex:
+    # In-memory dHash / pHash table over the local store; distances to one image are computed
+    # for all rows at once (XOR + popcount on uint64 arrays). numpy is imported in the methods, so
+    # importing this module (app start) does not load it
+    def __init__(self, path=HASH_INDEX_PATH):
+        import numpy as np
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._rows = {}      # sha256 -> row in the arrays
+        self._shas = []
+        self._paths = []
+        self._dhash = np.zeros(0, dtype=np.uint64)
+        self._phash = np.zeros(0, dtype=np.uint64)
+        self._aliases = {}   # pruned sha256 -> sha256 of the near-duplicate that was kept
+        self._replay()
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+
+    def _apply(self, record):
+        import numpy as np
+
+        sha256 = record["sha256"]
+        if record.get("removed"):
+            self._remove(sha256)
+            return
+        if "alias_of" in record:
+            self._remove(sha256)
+            self._aliases[sha256] = record["alias_of"]
+            return
+        self._aliases.pop(sha256, None)
+        if sha256 in self._rows:
+            return
+        self._rows[sha256] = len(self._shas)
+        self._shas.append(sha256)
+        self._paths.append(record["path"])
+        self._dhash = np.append(self._dhash, np.uint64(record["dhash"]))
+        self._phash = np.append(self._phash, np.uint64(record["phash"]))
+
+    def _remove(self, sha256):
+        import numpy as np
+
+        row = self._rows.pop(sha256, None)
+        if row is None:
+            return
+        del self._shas[row]
+        del self._paths[row]
+        self._dhash = np.delete(self._dhash, row)
+        self._phash = np.delete(self._phash, row)
+        self._rows = {sha: index for index, sha in enumerate(self._shas)}
+
+    def _write(self, records):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+        except OSError:
+            pass  # Read-only filesystem: keep the in-memory index only
+
+    def __contains__(self, sha256):
+        with self._lock:
+            return sha256 in self._rows
+
+    def __len__(self):
+        with self._lock:
+            return len(self._shas)
+
+    def add(self, sha256, path, dhash, phash):
+        record = {"sha256": sha256, "path": path, "dhash": dhash, "phash": phash}
+        with self._lock:
+            self._apply(record)
+            self._write([record])
+
+    def resolve(self, sha256):
+        # Local path for an image, following prunes to the copy that was kept (None if unknown)
+        with self._lock:
+            while sha256 in self._aliases:
+                sha256 = self._aliases[sha256]
+            row = self._rows.get(sha256)
+            return self._paths[row] if row is not None else None
+
+    def _lookup(self, shas):
+        # Rows for shas (after aliases), -1 where not indexed
+        import numpy as np
+
+        rows = []
+        for sha256 in shas:
+            while sha256 in self._aliases:
+                sha256 = self._aliases[sha256]
+            rows.append(self._rows.get(sha256, -1))
+        return np.array(rows, dtype=np.int64)
+
+    def similar(self, sha256, among, max_distance=SIMILAR_DISTANCE, limit=12):
+        # [(sha256, pHash distance)] of images in `among` close to sha256, closest first
+        import numpy as np
+
+        with self._lock:
+            target = self._lookup([sha256])[0]
+            rows = self._lookup(among)
+            if target < 0:
+                return []
+            known = rows >= 0
+            distances = np.full(len(rows), 65, dtype=np.int64)
+            distances[known] = np.bitwise_count(self._phash[rows[known]] ^ self._phash[target])
+        matches = [(among[i], int(distances[i])) for i in np.argsort(distances, kind="stable")
+                   if distances[i] <= max_distance and rows[i] != target]
+        return matches[:limit]
+
+    def duplicate_leaders(self, shas, max_distance=DUPLICATE_DISTANCE):
+        # Group near-duplicates in shas: for each position, the position of the first entry of its
+        # group (entries that are not indexed, e.g. None, are their own group)
+        import numpy as np
+
+        leaders = np.arange(len(shas))
+        with self._lock:
+            if not self._shas:
+                return leaders.tolist()
+            rows = self._lookup(shas)
+            dhash = self._dhash[np.maximum(rows, 0)]
+            phash = self._phash[np.maximum(rows, 0)]
+        unassigned = rows >= 0
+        for i in range(len(shas)):
+            if not unassigned[i]:
+                continue
+            close = (unassigned
+                     & (np.bitwise_count(dhash ^ dhash[i]) <= max_distance)
+                     & (np.bitwise_count(phash ^ phash[i]) <= max_distance))
+            leaders[close] = i
+            unassigned &= ~close
+        return leaders.tolist()
+
+    def forget(self, shas):
+        # Images deleted from the store by retention
+        records = [{"sha256": sha256, "removed": True} for sha256 in shas]
+        with self._lock:
+            for record in records:
+                self._apply(record)
+            self._write(records)
+
+    def prune(self, max_distance=DUPLICATE_DISTANCE):
+        # Delete near-duplicates from the store, keeping the earliest image of each group;
+        # returns (files removed, bytes freed). Pruned hashes resolve to the kept copy
+        with self._lock:
+            shas = list(self._shas)
+        leaders = self.duplicate_leaders(shas, max_distance)
+        removed, freed, records = 0, 0, []
+        with self._lock:
+            for position, leader in enumerate(leaders):
+                if leader == position or shas[position] not in self._rows:
+                    continue
+                sha256, kept = shas[position], shas[leader]
+                path = self._paths[self._rows[sha256]]
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    pass
+                record = {"sha256": sha256, "alias_of": kept}
+                self._apply(record)
+                records.append(record)
+                removed += 1
+            self._write(records)
+        return removed, freed
+
+
+def index_stored_image(sha256, path):
+    # Hash a freshly stored result (no-op if it is already indexed); failures are only logged
+    index = get_hash_index()
+    if sha256 in index:
+        return
+    try:
+        dhash, phash = run_image_task(perceptual_hash, path)
+    except Exception as e:
+        logger.warning("Could not hash %s: %s", path, e)
+        return
+    index.add(sha256, path, dhash, phash)
+
+
+_last_trim = 0.0
+_trim_lock = threading.Lock()
+
+
+def trim_local_store(keep=None):
+    # Apply the store's retention limits (if any) at most every STORE_TRIM_INTERVAL, and drop
+    # the deleted images from the index
+    global _last_trim
+    with _trim_lock:
+        if time.monotonic() - _last_trim < STORE_TRIM_INTERVAL:
+            return
+        _last_trim = time.monotonic()
+    removed = trim_store(keep=keep)
+    if removed:
+        logger.info("Retention removed %d stored images", len(removed))
+        get_hash_index().forget(removed)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_hash_index():
+    # Process-wide index shared by all sessions
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = HashIndex()
+        return _index
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import socket
+import requests
+import generation
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_callback_requires_token_and_only_hints(monkeypatch):
+    poller = generation.Poller(push_enabled=True)
+    monkeypatch.setattr(generation, "get_poller", lambda: poller)
+    monkeypatch.setattr(generation, "CALLBACK_URL", "http://127.0.0.1/callback")
+    monkeypatch.setattr(generation, "POLL_URL", "http://127.0.0.1:9/poll-result")  # Nothing listens there
+    port = free_port()
+    server = generation.start_callback_server(port)
+    try:
+        body = json.dumps({"request_id": "r1", "status": "done", "result_url": "http://169.254.169.254/"})
+        url = f"http://127.0.0.1:{port}/callback"
+        assert requests.post(url, data=body, timeout=5).status_code == 403
+        assert requests.post(url + "?token=wrong", data=body, timeout=5).status_code == 403
+        assert not poller._early
+
+        signed = generation.callback_url().replace("http://127.0.0.1/", f"http://127.0.0.1:{port}/")
+        assert requests.post(signed, data=body, timeout=5).status_code == 204
+        assert poller._early == {"r1"}  # Only the id is kept, never the posted result
+
+        watch = poller.watch("key", "r1")
+        assert poller._entries["r1"]["due"] <= time.monotonic()  # Polled at once, not after PUSH_POLL_INTERVAL
+        poller.unwatch(watch)
+    finally:
+        server.shutdown()
+
+
+def test_adaptive_polling_until_the_first_push():
+    poller = generation.Poller(interval=2, push_enabled=True)
+    entry = {"expected": None, "submitted": time.monotonic()}
+    assert poller._next_interval(entry) == 2  # Upstream may ignore callback_url
+    poller.push("unknown")
+    assert poller._next_interval(entry) == generation.PUSH_POLL_INTERVAL
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from imagestore import trim_store
+from similarity import HashIndex
+
+
+def store_file(store_dir, sha256, size, age_days=0):
+    path = os.path.join(store_dir, sha256[:2], f"{sha256}.png")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_no_limits_keeps_everything(tmp_path):
+    store_file(tmp_path, "aa11", 1024, age_days=365)
+    assert trim_store(str(tmp_path), max_mb=0, max_days=0) == []
+
+
+def test_size_cap_removes_oldest_first(tmp_path):
+    megabyte = 1024 * 1024
+    store_file(tmp_path, "aa11", megabyte, age_days=3)
+    store_file(tmp_path, "bb22", megabyte, age_days=2)
+    newest = store_file(tmp_path, "cc33", megabyte, age_days=1)
+    assert trim_store(str(tmp_path), max_mb=2, max_days=0) == ["aa11"]
+    assert os.path.exists(newest)
+
+
+def test_age_cap_and_keep(tmp_path):
+    old = store_file(tmp_path, "aa11", 10, age_days=40)
+    store_file(tmp_path, "bb22", 10, age_days=31)
+    store_file(tmp_path, "cc33", 10, age_days=1)
+    assert trim_store(str(tmp_path), max_mb=0, max_days=30, keep=old) == ["bb22"]
+    assert os.path.exists(old)
+
+
+def test_forgotten_images_stay_forgotten(tmp_path):
+    path = str(tmp_path / "hashes.jsonl")
+    index = HashIndex(path)
+    index.add("aa11", "a.png", 1, 2)
+    index.add("bb22", "b.png", 3, 4)
+    index.forget(["aa11"])
+    assert "aa11" not in index and index.resolve("bb22") == "b.png"
+    assert "aa11" not in HashIndex(path) and len(HashIndex(path)) == 1
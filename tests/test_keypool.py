@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from keypool import KeyPool, KEY_MAX_FAILURES
+
+
+def rejected(http_status, retry_after=None):
+    return {"status": "rejected", "http_status": http_status, "retry_after": retry_after, "quota_remaining": None}
+
+
+def test_least_loaded_key_first():
+    pool = KeyPool(["a", "b"])
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first, second} == {"a", "b"}
+    pool.release(first, {"status": "completed", "http_status": 200})
+    assert pool.acquire() == first
+
+
+def test_bad_requests_do_not_disable_key():
+    pool = KeyPool(["only"])
+    for status_code in (400, 413, 422, 400, 400):
+        assert pool.acquire(timeout=0) == "only"
+        pool.release("only", rejected(status_code))
+    assert pool.acquire(timeout=0) == "only"
+
+
+def test_server_errors_disable_key():
+    pool = KeyPool(["only"])
+    for status_code in [500, None, 503][:KEY_MAX_FAILURES]:
+        assert pool.acquire(timeout=0) == "only"
+        pool.release("only", {"status": "error", "http_status": status_code})
+    assert pool.acquire(timeout=0) is None
+
+
+def test_success_resets_failures():
+    pool = KeyPool(["only"])
+    for _ in range(KEY_MAX_FAILURES - 1):
+        pool.release(pool.acquire(timeout=0), rejected(502))
+    pool.release(pool.acquire(timeout=0), {"status": "completed", "http_status": 200})
+    pool.release(pool.acquire(timeout=0), rejected(502))
+    assert pool.acquire(timeout=0) == "only"
+
+
+def test_auth_failure_disables_key():
+    pool = KeyPool(["bad", "good"])
+    key = pool.acquire(timeout=0)
+    pool.release(key, rejected(401))
+    other = ({"bad", "good"} - {key}).pop()
+    assert [pool.acquire(timeout=0) for _ in range(3)] == [other] * 3
+
+
+def test_rate_limited_key_is_waited_for():
+    pool = KeyPool(["only"])
+    pool.release(pool.acquire(timeout=0), rejected(429, retry_after=0.2))
+    start = time.monotonic()
+    assert pool.acquire(timeout=5) == "only"
+    assert 0.15 < time.monotonic() - start < 2
+
+
+def test_wait_is_bounded():
+    pool = KeyPool(["only"])
+    pool.release(pool.acquire(timeout=0), rejected(429, retry_after=30))
+    start = time.monotonic()
+    assert pool.acquire(timeout=0.2) is None
+    assert time.monotonic() - start < 0.1  # Known to be too far away: no point sleeping
+
+
+def test_cancel_stops_the_wait():
+    pool = KeyPool(["only"])
+    pool.release(pool.acquire(timeout=0), rejected(429, retry_after=2))
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    start = time.monotonic()
+    assert pool.acquire(timeout=5, cancel=cancel) is None
+    assert time.monotonic() - start < 1
+
+
+def test_empty_pool():
+    assert KeyPool([]).acquire() is None
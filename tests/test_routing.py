@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from routing import ModelRouter, PRIOR_LATENCY, MIN_SAMPLES
+
+CAPABILITIES = {"A": {"text_to_image": True}, "B": {"text_to_image": True}}
+MODELS = {"A": "model-a", "B": "model-b"}
+
+
+def test_untried_model_gets_the_prior():
+    router = ModelRouter()
+    router.observe("model-a", False, 10)
+    assert router.stats("model-a")["score"] == PRIOR_LATENCY
+
+
+def test_all_failed_model_loses_to_a_slow_healthy_one():
+    router = ModelRouter()
+    for _ in range(MIN_SAMPLES):
+        router.observe("model-a", False, 5)
+        router.observe("model-b", True, 70)
+    assert router.stats("model-a")["success_rate"] == 0
+    assert router.choose(MODELS, CAPABILITIES, has_reference=False)[0] == "B"
+
+
+def test_faster_model_wins():
+    router = ModelRouter()
+    for _ in range(MIN_SAMPLES):
+        router.observe("model-a", True, 30)
+        router.observe("model-b", True, 50)
+    short, stats = router.choose(MODELS, CAPABILITIES, has_reference=False)
+    assert short == "A" and stats["p50"] == 30
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import generation
+from scheduler import JobScheduler
+
+
+def blocking_runner(release_event, seen):
+    def runner(api_key, payload, reserve_slot=None, **kwargs):
+        seen.append(payload["n"])
+        release_event.wait(5)
+        return {"status": "ok"}
+    return runner
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_hedge_slot_counts_against_max_in_flight():
+    done = threading.Event()
+    seen = []
+    scheduler = JobScheduler(max_in_flight=2, runner=blocking_runner(done, seen))
+    scheduler.submit("a", None, {"n": 1})
+    assert wait_for(lambda: seen == [1])
+    release = scheduler.reserve_slot()
+    assert release is not None
+    assert scheduler.reserve_slot() is None  # Both slots taken
+
+    scheduler.submit("b", None, {"n": 2})
+    time.sleep(0.1)
+    assert seen == [1] and scheduler.stats()["queued"] == 1  # Waits for the hedge's slot
+    release()
+    assert wait_for(lambda: seen == [1, 2])
+    done.set()
+
+
+def test_no_hedge_slot_while_jobs_are_queued():
+    done = threading.Event()
+    seen = []
+    scheduler = JobScheduler(max_in_flight=1, runner=blocking_runner(done, seen))
+    scheduler.submit("a", None, {"n": 1})
+    scheduler.submit("a", None, {"n": 2})
+    assert wait_for(lambda: seen == [1])
+    assert scheduler.reserve_slot() is None
+    done.set()
+
+
+def test_hedge_spend_window_and_refund(monkeypatch):
+    monkeypatch.setattr(generation, "_hedge_spend", generation.deque())
+    monkeypatch.setattr(generation, "estimate_cost", lambda prices, model_id, images: 0.4)
+    monkeypatch.setattr(generation, "HEDGE_SPEND_CAP", 1.0)
+    first = generation._reserve_hedge("m")
+    assert generation._reserve_hedge("m") is not None
+    assert generation._reserve_hedge("m") is None  # 1.2 > 1.0
+    generation._refund_hedge(first)
+    assert generation._reserve_hedge("m") is not None
+
+    monkeypatch.setattr(generation, "HEDGE_SPEND_WINDOW", 0.0)
+    time.sleep(0.01)
+    assert generation._reserve_hedge("m") is not None  # Older bookings have left the window
+
+
+def test_submitted_hedge_loser_is_costed(monkeypatch, tmp_path):
+    from ledger import Ledger
+    ledger = Ledger(str(tmp_path / "ledger.jsonl"), prices={"m2": {"per_image": 0.02}})
+    monkeypatch.setattr(generation, "get_ledger", lambda: ledger)
+    result = {"status": "cancelled", "request_id": "r1", "timings": {"total": 1.0}, "polls": 1, "latency": 1.0}
+    generation._record(result, {"model_id": "m2"}, "s", hedge_loser=True)
+    unsubmitted = dict(result, request_id=None)
+    generation._record(unsubmitted, {"model_id": "m2"}, "s", hedge_loser=True)
+    assert ledger.total_cost == 0.02
+    assert ledger.by_model["m2"]["errors"] == 1  # Only the unsubmitted one
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import io
+import json
+import sys
+import time
+import threading
+import argparse
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+import metrics
+import ratelimit
+from ledger import get_ledger
+
+OPENROUTER_API_BASE = os.environ.get("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1").rstrip("/")
+OPENROUTER_CHAT_URL = f"{OPENROUTER_API_BASE}/chat/completions"
+OPENROUTER_CREDITS_URL = f"{OPENROUTER_API_BASE}/credits"
+
+# Credit balance cache lifetime (seconds)
+CREDITS_TTL = float(os.environ.get("CREDITS_TTL", "60"))
+
+# Translation models (display name -> OpenRouter model id)
+# Override with TRANSLATION_MODELS="Name=vendor/model,Name2=vendor/model2"
+DEFAULT_TRANSLATION_MODELS = {
+    "Hermes-3-Llama-3.1-405B": "nousresearch/hermes-3-llama-3.1-405b",
+    "DeepSeek-V3": "deepseek/deepseek-chat"
+}
+
+# Shared deadline for one fan-out (seconds)
+TRANSLATION_DEADLINE = float(os.environ.get("TRANSLATION_DEADLINE", "30"))
+
+# System prompt for better translation
+SYSTEM_PROMPT = """You are a professional Japanese-to-English translator specializing in AI image generation prompts.
+
+TRANSLATION RULES:
+1. ACCURACY FIRST: Translate Japanese text literally and accurately into English
+2. PRESERVE ORIGINAL MEANING: Do NOT add descriptive words, emotions, or atmosphere that are NOT in the original Japanese
+3. OUTPUT FORMAT: Provide ONLY the English translation, no explanations
+
+Translate accurately based on the actual content."""
+
+
+def load_translation_models():
+    raw = os.environ.get("TRANSLATION_MODELS", "").strip()
+    if not raw:
+        return dict(DEFAULT_TRANSLATION_MODELS)
+
+    models = {}
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=" in entry:
+            name, model_id = entry.split("=", 1)
+        else:
+            name, model_id = entry, entry
+        models[name.strip()] = model_id.strip()
+    return models or dict(DEFAULT_TRANSLATION_MODELS)
+
+
+def translate(openrouter_api_key, model_id, japanese_prompt, timeout=30, session="headless"):
+    # One translation call; never raises, errors are reported in the result
+    result = {"text": "", "error": None, "latency": 0.0, "status_code": None, "retry_after": None,
+              "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": None}
+    start = time.monotonic()
+    try:
+        body = json.dumps({
+            "model": model_id,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": japanese_prompt}
+            ],
+            "temperature": 0.9,
+            "usage": {"include": True}
+        }).encode()
+        if not ratelimit.acquire("openrouter.chat", timeout=timeout):
+            raise RuntimeError("local rate limit: no request slot before the timeout")
+        metrics.bytes_uploaded.inc(len(body), upstream="openrouter")
+        response = requests.post(
+            OPENROUTER_CHAT_URL,
+            headers={
+                "Authorization": f"Bearer {openrouter_api_key}",
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://eternal-ai-generator.streamlit.app",
+                "X-Title": "EternalAI Image Generator"
+            },
+            data=body,
+            timeout=timeout
+        )
+        metrics.bytes_downloaded.inc(len(response.content), upstream="openrouter")
+
+        result["status_code"] = response.status_code
+        if response.status_code == 429:
+            try:
+                result["retry_after"] = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                result["retry_after"] = None
+
+        if response.status_code == 200:
+            data = response.json()
+            usage = data.get("usage") or {}
+            result["prompt_tokens"] = usage.get("prompt_tokens", 0)
+            result["completion_tokens"] = usage.get("completion_tokens", 0)
+            result["total_tokens"] = usage.get("total_tokens", 0)
+            result["cost"] = usage.get("cost")
+            if "choices" in data and len(data["choices"]) > 0:
+                result["text"] = data["choices"][0]["message"]["content"].strip()
+            else:
+                result["error"] = "Error: No translation returned"
+        else:
+            error_msg = response.text[:200] if response.text else "Unknown error"
+            result["error"] = f"Error {response.status_code}: {error_msg}"
+    except Exception as e:
+        result["error"] = f"Error: {str(e)}"
+
+    result["latency"] = time.monotonic() - start
+    metrics.translations.inc(model=model_id, status="ok" if not result["error"] else "error")
+    metrics.translation_latency.observe(result["latency"], model=model_id)
+    ledger_record = get_ledger().record(
+        "translation", model_id, session, result["latency"],
+        status="ok" if not result["error"] else "error",
+        prompt_tokens=result["prompt_tokens"],
+        completion_tokens=result["completion_tokens"],
+        cost=result["cost"]
+    )
+    result["cost"] = ledger_record["cost"]
+    return result
+
+
+def translate_all(openrouter_api_key, models, japanese_prompt, deadline=TRANSLATION_DEADLINE, session="headless"):
+    # Fan out to every model at once; whatever is not back by the deadline is reported as a timeout
+    if not models:
+        return {}
+
+    executor = ThreadPoolExecutor(max_workers=len(models), thread_name_prefix="translate")
+    futures = {
+        executor.submit(translate, openrouter_api_key, model_id, japanese_prompt, deadline, session): model_name
+        for model_name, model_id in models.items()
+    }
+    done, _ = wait(futures, timeout=deadline)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for future, model_name in futures.items():
+        if future in done:
+            results[model_name] = future.result()
+        else:
+            results[model_name] = {"text": "", "error": f"Error: Timeout ({deadline:.0f}s)",
+                                   "latency": deadline, "status_code": None,
+                                   "retry_after": None, "prompt_tokens": 0,
+                                   "completion_tokens": 0, "total_tokens": 0, "cost": 0.0}
+    # Keep configured order
+    return {model_name: results[model_name] for model_name in models}
+
+
+# ---- Credit balance ----
+
+def fetch_credits(openrouter_api_key, timeout=10):
+    # Returns (balance, error)
+    try:
+        if not ratelimit.acquire("openrouter.credits", timeout=timeout):
+            return None, "Credit fetch skipped: local rate limit"
+        response = requests.get(
+            OPENROUTER_CREDITS_URL,
+            headers={"Authorization": f"Bearer {openrouter_api_key}"},
+            timeout=timeout
+        )
+        if response.status_code == 200:
+            credits = response.json().get("data", {})
+            return credits.get("total_credits", 0) - credits.get("total_usage", 0), None
+        return None, f"Failed to fetch credit balance: {response.status_code}"
+    except Exception as e:
+        return None, f"Credit fetch error: {str(e)}"
+
+
+class CreditCache:
+    # Balance per key hash, refreshed on a background thread so page reruns never wait on OpenRouter
+    def __init__(self, ttl=CREDITS_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._refreshing = set()
+
+    @staticmethod
+    def _key_hash(openrouter_api_key):
+        return hashlib.sha256(openrouter_api_key.encode()).hexdigest()
+
+    def get(self, openrouter_api_key):
+        # Returns the cached entry ({"balance", "error", "fetched_at"}) or None while the first fetch runs
+        key_hash = self._key_hash(openrouter_api_key)
+        with self._lock:
+            entry = self._entries.get(key_hash)
+        if entry is None or time.monotonic() - entry["fetched_at"] > self.ttl:
+            self.refresh(openrouter_api_key)
+        return entry
+
+    def peek(self, openrouter_api_key):
+        # The cached entry without starting a refresh
+        with self._lock:
+            return self._entries.get(self._key_hash(openrouter_api_key))
+
+    def refresh(self, openrouter_api_key):
+        key_hash = self._key_hash(openrouter_api_key)
+        with self._lock:
+            if key_hash in self._refreshing:
+                return
+            self._refreshing.add(key_hash)
+        threading.Thread(target=self._fetch, args=(openrouter_api_key, key_hash),
+                         name="credits-refresh", daemon=True).start()
+
+    def _fetch(self, openrouter_api_key, key_hash):
+        balance, error = fetch_credits(openrouter_api_key)
+        with self._lock:
+            previous = self._entries.get(key_hash)
+            if error and previous and previous["balance"] is not None:
+                # Keep showing the last known balance when a refresh fails
+                balance = previous["balance"]
+            self._entries[key_hash] = {"balance": balance, "error": error, "fetched_at": time.monotonic()}
+            self._refreshing.discard(key_hash)
+
+
+credit_cache = CreditCache()
+
+
+# ---- Batch translation (prompt files) ----
+
+# Column names recognised as the Japanese prompt in CSV input (first column otherwise)
+PROMPT_COLUMNS = ("japanese", "japanese_prompt", "prompt", "日本語", "プロンプト")
+
+BATCH_WORKERS = 4
+BATCH_MAX_RETRIES = 3
+
+
+def read_prompts(data, filename=""):
+    # data: str or bytes of a .csv or plain text (one prompt per line) file
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+
+    if not filename.lower().endswith(".csv"):
+        return [line.strip() for line in data.splitlines() if line.strip()]
+
+    rows = list(csv.reader(io.StringIO(data)))
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = next((header.index(name) for name in PROMPT_COLUMNS if name in header), None)
+    if column is None:
+        # No recognised header: treat every row as data, prompt in first column
+        column, body = 0, rows
+    else:
+        body = rows[1:]
+    return [row[column].strip() for row in body if len(row) > column and row[column].strip()]
+
+
+class _Cooldown:
+    # Shared pause for all workers after a 429 from OpenRouter
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = 0.0
+
+    def wait(self):
+        while True:
+            with self._lock:
+                remaining = self._until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + seconds)
+
+
+def _translate_with_retry(openrouter_api_key, model_id, japanese_prompt, cooldown, max_retries, session):
+    for attempt in range(max_retries + 1):
+        cooldown.wait()
+        result = translate(openrouter_api_key, model_id, japanese_prompt, session=session)
+        status_code = result["status_code"] or 0
+        if status_code != 429 and status_code < 500 or attempt == max_retries:
+            break
+        # Rate limited / upstream error: pause every worker (honour Retry-After when present)
+        cooldown.pause(result["retry_after"] or min(2 ** attempt, 30))
+    result["attempts"] = attempt + 1
+    return result
+
+
+def translate_batch(openrouter_api_key, model_id, prompts, workers=BATCH_WORKERS,
+                    max_retries=BATCH_MAX_RETRIES, on_progress=None, session="headless"):
+    # Translate every prompt with a bounded worker pool; returns JSONL-ready records in input order
+    cooldown = _Cooldown()
+    records = [None] * len(prompts)
+    completed = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch-translate") as executor:
+        futures = {
+            executor.submit(_translate_with_retry, openrouter_api_key, model_id, prompt, cooldown,
+                            max_retries, session): index
+            for index, prompt in enumerate(prompts)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            result = future.result()
+            records[index] = {
+                "id": index + 1,
+                "japanese": prompts[index],
+                "prompt": result["text"],
+                "translation_model": model_id,
+                "latency": round(result["latency"], 3),
+                "total_tokens": result["total_tokens"],
+                "attempts": result["attempts"],
+                "error": result["error"]
+            }
+            completed += 1
+            if on_progress:
+                on_progress(completed, len(prompts))
+    return records
+
+
+def to_jsonl(records):
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+
+def main(argv=None):
+    # Headless: python translation.py prompts.csv -o prompts.jsonl
+    parser = argparse.ArgumentParser(description="Batch Japanese -> English prompt translation (JSONL output)")
+    parser.add_argument("input", help="CSV (japanese/prompt column) or text file with one prompt per line")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output path (default: stdout)")
+    parser.add_argument("-m", "--model", default=next(iter(load_translation_models().values())),
+                        help="OpenRouter model id")
+    parser.add_argument("-w", "--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--retries", type=int, default=BATCH_MAX_RETRIES)
+    args = parser.parse_args(argv)
+
+    openrouter_api_key = os.environ.get("OPENROUTER_API_KEY")
+    if not openrouter_api_key:
+        parser.error("OPENROUTER_API_KEY is not set")
+
+    with open(args.input, "rb") as f:
+        prompts = read_prompts(f.read(), args.input)
+
+    def progress(done, total):
+        print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    records = translate_batch(openrouter_api_key, args.model, prompts, args.workers, args.retries, progress)
+    print(file=sys.stderr)
+
+    if args.output == "-":
+        sys.stdout.write(to_jsonl(records))
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(to_jsonl(records))
+
+    failed = sum(1 for record in records if record["error"])
+    print(f"{len(records) - failed} translated, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())